@@ -1,85 +1,27 @@
 from __future__ import print_function
 import argparse
+import functools
+import os
+import sys
 import torch
-import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
+import torch.distributed as dist
 import numpy.random as random
-import numpy as np
-import pandas as pd
-from torchvision import datasets, transforms
-
-class LeNet5(nn.Module):
-
-    def __init__(self):
-        super(LeNet5, self).__init__()
-        self.conv1 = nn.Conv2d(1, 6, 5, 1)
-        self.conv2 = nn.Conv2d(6, 16, 5, 1)
-        self.fc1 = nn.Linear(256, 120)
-        self.fc2 = nn.Linear(120,84)
-        self.fc3 = nn.Linear(84,10)
-
-
-    def forward(self, x):
-        x = F.relu(self.conv1(x))
-        x = F.max_pool2d(x, 2, 2)
-        x = F.relu(self.conv2(x))
-        x = F.max_pool2d(x, 2, 2)
-        x = x.view(-1, 256)
-        x = F.relu(self.fc1(x))
-        x = F.relu(self.fc2(x))
-        x = self.fc3(x)
-        return F.log_softmax(x, dim=1)
-        
-class Net_FC(nn.Module):
-    def __init__(self):
-        super(Net_FC, self).__init__()
-        self.fc1 = nn.Linear(784, 500)
-        self.fc2 = nn.Linear(500, 10)
-        
-    def forward(self, x):
-        x = x.view(-1, 784)
-        x = F.relu(self.fc1(x))
-        x = self.fc2(x)
-        return F.log_softmax(x, dim=1)
-        
-def get_indices(dataset,class_name):
-    indices =  []
-    for i in range(len(dataset.targets)):
-        if dataset.targets[i] == class_name:
-            indices.append(i)
-    return indices
-
-
-## functions for top-s sparsification
-def sparsify1(atensor,sfactor): # sparsification operator for vector
-    s = int(sfactor*len(atensor)) # compute s to nearest smaller integer
-
-    if s < 1: # s is too small
-        return atensor
-    
-    elif s == 1:
-        themax = atensor.abs().max() # element of largest magnitude in atensor
-        atensor[atensor.abs() < themax] = 0 # sparsify atensor
-        return atensor
-    
-    elif s > 1:
-        # flatten absolute value of atensor into a list
-        alist = atensor.abs().flatten().tolist()
-        alist.sort() # sort from smallest to largest
-        # sparsify atensor using k-th largest element of alist
-        atensor[atensor.abs() < alist[-s]] = 0
-        return atensor
-
-def sparsify2(atensor,sfactor): # sparsification operator for tensor
-    size = list(atensor.size()) # get shape of atensor
-    s = int(sfactor*np.prod(size)) # compute s to nearest smaller integer
-    
-    alist = atensor.abs().flatten().tolist()
-    alist.sort()
-    atensor[atensor.abs() < alist[-s]] = 0
-    return atensor
-
+import fmnist_cache
+import synthetic as synthetic_data
+from models import Net_FC, num_params
+from async_eval import AsyncEvaluator
+from checkpoint import Checkpointer, rng_state, set_rng_state, resolve
+from instrument import PhaseTimer, Tracer
+from partition import SCHEMES, partition, shard
+from compression import sparsify_payload, sparsify_rows
+import error_feedback
+from error_feedback import GradientPipeline, WorkerGroup, ServerState, bucketed_params, flatten_grads
+from batched_grads import grouped_flat_grads
+from budget import BudgetController
+import parameter_server
+from sweep import grid, result_name, run_sweep
 
 def test(model, device, Xtest, ytest, b_sz):
     model.eval()
@@ -106,51 +48,45 @@ def test(model, device, Xtest, ytest, b_sz):
     return(test_loss, 100. * correct / t_sz)
 
 
-def main(b_sz,lr,sfactor): # pass in training batch size, learning rate, sfactor
+def load_data(scheme='class', num_workers=10, alpha=0.5, synthetic=None, b_sz=1): # normalized FashionMNIST, training set split across the local servers
+    # normalized arrays memory-mapped from the local cache, or a synthetic set with the settings synthetic
+    Xtrain, ytrain = synthetic_data.dataset(train=True, synthetic=synthetic, download=True)
+    Xtest, ytest = synthetic_data.dataset(train=False, synthetic=synthetic)
+    
+    # shards by class (local server i gets class i), IID or Dirichlet(alpha), cached on disk for FashionMNIST;
+    # the training set is reordered once and every local server gets a contiguous view of it,
+    # of at least one minibatch of b_sz samples
+    order, offsets = partition(ytrain.numpy(), scheme, num_workers, alpha=alpha,
+                               cache_dir=fmnist_cache.cache_dir() if synthetic is None else None, min_size=b_sz)
+    local_Xtrain, local_ytrain = shard(Xtrain, ytrain, order, offsets)
+
+    return local_Xtrain, local_ytrain, Xtest, ytest
+
+def main(b_sz,lr,sfactor,value_dtype=torch.float32,batched=False,maxepoch=10,scheme='class',alpha=0.5,
+         checkpoint=None,checkpoint_every=1,metrics=None,timers=False,profile=None,profile_start=10,profile_steps=5,
+         synthetic=None,model_size=None,pipelined=False,bucket_bytes=None,budget=None):
+    # pass in training batch size, learning rate, sfactor, dtype of sent values,
+    # whether to compute and compress the gradients of all local servers in one batched call, epochs,
+    # split of the training set, the checkpoint file to resume from and save to, the MetricsWriter of the run,
+    # whether to print per-phase times each epoch, the Chrome trace file of rounds [profile_start, +profile_steps),
+    # settings of synthetic.load to train on instead of FashionMNIST, the width and depth of Net_FC, whether
+    # to compress each layer while backward is still running, the bucket size of error_feedback.bucket_ranges,
+    # and the bytes per round to spend, choosing the sfactor of every bucket each round instead of sfactor
     # Training settings
     use_cuda = False
     device = torch.device("cuda" if use_cuda else "cpu")
     torch.manual_seed(20200930)
      
-    dataset_train = datasets.FashionMNIST('data', train=True, download=True,
-                        transform=transforms.Compose([
-                        transforms.ToTensor(),
-                        transforms.Normalize((0.1307,), (0.3081,))
-                        ]))
-                        
-    dataset_test = datasets.FashionMNIST('data', train=False, transform=transforms.Compose([
-                           transforms.ToTensor(),
-                           transforms.Normalize((0.1307,), (0.3081,))
-                       ]))
-    
-    Xtrain = dataset_train.data.float()
-    Xtrain.mul_(1./255.)
-    Xtrain.add_(-0.1307)
-    Xtrain.mul_(0.3081)
-
-    ytrain = dataset_train.targets
-    
-    Xtest = dataset_test.data.float()
-    Xtest.mul_(1./255.)
-    Xtest.add_(-0.1307)
-    Xtest.mul_(0.3081)
+    local_Xtrain, local_ytrain, Xtest, ytest = load_data(scheme, 10, alpha, synthetic, b_sz)
 
-    ytest = dataset_test.targets
     
-    local_Xtrain = []
-    local_ytrain = []
+    b_sz_test = len(ytest) # whole test set in one batch
     
-    for i in range(10):
     
-        idx = get_indices(dataset_train, i)
-        local_Xtrain.append(Xtrain[idx,])
-        local_ytrain.append(ytrain[idx,])
-
-    
-    b_sz_test = 1000
-    
-    
-    model = Net_FC().to(device)
+    model = Net_FC(input_shape=tuple(Xtest.shape[1:]), num_classes=synthetic_data.num_classes(synthetic),
+                   **(model_size or {})).to(device)
+    if synthetic is not None or model_size:
+        print('{} parameters'.format(num_params(model)))
     #model = LeNet5().to(device)
 
     
@@ -169,286 +105,247 @@ def main(b_sz,lr,sfactor): # pass in training batch size, learning rate, sfactor
     alpha0 = 1
 
     
-    iter_per_epoch = 60000//(10*b_sz)
-    maxepoch = 10
-    #maxepoch = 30
-
-    errloc = [] # list to store compression errors at local servers
-    errcen = [] # list to store compression errors at central server
-    gradloc = [] # list to store gradients at local servers
-    for layer in range(num_layer):
-        gradloc.append(torch.zeros(num_neurons[layer]))
-        errloc += [[]] # append empty list to create nested list
-        errcen += [[]]
+    n_train = sum(len(y) for y in local_ytrain) # 60000 for FashionMNIST
+    iter_per_epoch = n_train//(10*b_sz)
+
+    workers = WorkerGroup(10, num_neurons, bucket_bytes=bucket_bytes) # compression error of each local server
+    server = ServerState(num_neurons, 10, bucket_bytes=bucket_bytes) # aggregated gradient and compression error of central server
+    params = bucketed_params(model.parameters(), bucket_bytes) # updated bucket by bucket by the central server
+    gradbuf = torch.zeros(sum(p.numel() for p in model.parameters())) # flat gradient of one local server
+    gradblock = torch.zeros(10, gradbuf.numel()) # flat gradients of all local servers in batched mode
+    compress = lambda v: sparsify_payload(v,sfactor,value_dtype) # compress into (index, value) pairs
+    compress_rows = lambda V: sparsify_rows(V,sfactor,value_dtype) # same, for all local servers at once
+    controller = None
+    if budget is not None: # sfactor of every bucket from the running compression errors
+        controller = BudgetController(workers.columns, budget, 10, 'top-s', value_dtype)
+        compress, compress_rows = controller.compress, controller.compress_rows
 
     testloss = [] # list to store average test loss
     testacc = [] # list to store prediction accuracy
+    commbytes = [] # list to store average bytes communicated per round
 
     
-    for epoch in range(maxepoch):
+    evaluator = AsyncEvaluator(model, lambda model: test(model, device, Xtest, ytest, b_sz_test))
+    tests = [] # test result of each epoch, pending ones as futures
+    start_epoch = 0
+    checkpointer = Checkpointer(checkpoint, checkpoint_every) if checkpoint is not None else None
+    state = checkpointer.load() if checkpointer is not None else None
+    if state is not None: # resume right after the last checkpointed epoch
+        model.load_state_dict(state['model'])
+        workers.block.copy_(state['workers']) # compression errors of the local servers
+        server.err.copy_(state['server']) # compression error of the central server
+        set_rng_state(state['rng'])
+        iter = state['iter']
+        tests = state['tests']
+        commbytes = state['commbytes']
+        start_epoch = state['epoch'] + 1
+        if controller is not None and state.get('controller') is not None:
+            controller.load_state_dict(state['controller'])
+        if metrics is not None and state['metrics'] is not None: # drop the rows logged after the checkpoint
+            metrics.rewind(state['metrics'])
+        print('Resuming from {} after epoch {}'.format(checkpoint, state['epoch']))
+    elif metrics is not None and checkpointer is not None: # no checkpoint yet, rows of an earlier attempt start over
+        metrics.rewind(0)
+
+    if pipelined and batched:
+        raise ValueError('pipelined compression hooks the sequential backward passes, it cannot be batched')
+    pipeline = GradientPipeline(model.parameters(), compress, bucket_bytes) if pipelined else None
+    timer = PhaseTimer(timers, record=profile is not None) # per-epoch breakdown of a round
+    tracer = Tracer(profile, profile_start, profile_steps) # Chrome trace of a window of rounds
+    for epoch in range(start_epoch, maxepoch):
+        timer.reset()
+        epochbytes = 0 # bytes sent by local and central servers during this epoch
+        if metrics is not None:
+            metrics.timer()
         for k in range(iter_per_epoch):
-            for i in range(10):
-                st_idx = random.randint(0, 6000 - b_sz + 1)
-                data = local_Xtrain[i][st_idx:st_idx+b_sz,]
-                target = local_ytrain[i][st_idx:st_idx+b_sz,]
+            server.start_round()
+            if batched:
+                # stack the minibatches of all local servers and get their gradients in one call
+                st_idx = random.randint(0, [len(y) - b_sz + 1 for y in local_ytrain])
+                data = torch.stack([local_Xtrain[i][st_idx[i]:st_idx[i]+b_sz,] for i in range(10)])
+                target = torch.stack([local_ytrain[i][st_idx[i]:st_idx[i]+b_sz,] for i in range(10)])
                 data, target = data.to(device), target.to(device)
-                optimizer.zero_grad()
-                output = model(data)
-                loss = F.nll_loss(output, target)
-                loss.backward()
+                with timer.phase('forward+backward'):
+                    _, losses = grouped_flat_grads(model, data, target, out=gradblock)
+                loss = losses[-1]
+                # compress every gradient (with error compensation) and send to the central server
+                with timer.phase('local compression'): # includes adding them up on the central server
+                    workers.compress(gradblock, compress_rows, server)
+            else:
+                for i in range(10):
+                    st_idx = random.randint(0, len(local_ytrain[i]) - b_sz + 1)
+                    data = local_Xtrain[i][st_idx:st_idx+b_sz,]
+                    target = local_ytrain[i][st_idx:st_idx+b_sz,]
+                    data, target = data.to(device), target.to(device)
+                    with timer.phase('forward'):
+                        optimizer.zero_grad()
+                        output = model(data)
+                        loss = F.nll_loss(output, target)
+                    if pipeline is not None: # compress each layer on a thread as soon as its gradient is ready
+                        pipeline.start(workers[i])
+                    with timer.phase('backward'):
+                        loss.backward()
                         
-                # now the stochastic gradient is computed by the i-th dataset
-                # compress the gradient (with error compensation) and send to the central server
-                player = 0 # counter to keep track of layers            
-                for p in model.parameters():
-                    gradclone = p.grad.clone() # clone gradient
-
-                    if k == 0:
-                        if player % 2 == 0: # compress gradclone based on layer
-                            gradclone = sparsify2(gradclone,sfactor)
-                        elif player % 2 == 1:
-                            gradclone = sparsify1(gradclone,sfactor)
+                    # now the stochastic gradient is computed by the i-th dataset
+                    # compress the gradient (with error compensation) and send to the central server
+                    with timer.phase('local compression'):
+                        if pipeline is not None:
+                            payloads = pipeline.finish() # the buckets still in flight
+                        else:
+                            flatten_grads(model.parameters(), gradbuf)
+                            payloads = workers[i].compress(gradbuf, compress)
+                    with timer.phase('aggregation'):
+                        server.receive(payloads)
 
-                    else:
-                        # add last compression error to gradient
-                        gradclone.add_(errloc[player][-1])
-                        if player % 2 == 0: # compress result
-                            gradclone = sparsify2(gradclone,sfactor)
-                        elif player % 2 == 1:
-                            gradclone = sparsify1(gradclone,sfactor)
-
-                    # aggregate local compressed gradient
-                    gradloc[player].add_(gradclone) 
-                    gradclone.mul_(-1)
-                    p.grad.add_(gradclone) # compute compression error
-                    errloc[player] += [p.grad] # store compression error
-                    player += 1 # update layer counter
-
-                
-                        
             # the central server receives all compressed stochastic gradients
             # average them, then compress the averaged gradient with error compensation, and broadcast to local servers
-           
-            gradcen = [] # list to store gradients for central server
-            for i in range(0,len(gradloc)):
-                agrad = torch.Tensor(gradloc[i]) # make sure gradient is tensor
-                agrad.mul_(0.1) # average each gradient
-                gradcen += [agrad] # store agrad in gradcen
-
-            player = 0
-            for p in model.parameters(): # access global model
-                v = gradcen[player].clone() # get gradient for this layer
-                vclone = v.clone() # clone gradient
-                
-                if k == 0:
-                    if player % 2 == 0: # compress vclone based on layer
-                        v = sparsify2(v,sfactor)
-                    elif player % 2 == 1:
-                        v = sparsify1(v,sfactor)
-
-                else:
-                    # add last compression error to compressed gradient
-                    v.add_(errcen[player][-1])
-                    if player % 2 == 0:
-                        v = sparsify2(v,sfactor)
-                    elif player % 2 == 1:
-                        v = sparsify1(v,sfactor)
-
-                v.mul_(-1)
-                vclone.add_(v) # compute central compression error
-                errcen[player] = [vclone] # store compression error
-                v.mul_(alpha0/(iter**0.5)) # use step size for vanilla SGD
-                p.data.add_(v) # update global model
-                player += 1
-                
+            server.update(params, compress, alpha0/(iter**0.5), timer) # use step size for vanilla SGD
+
+            epochbytes += server.nbytes
+            if controller is not None: # settings of the next round from the errors and bytes of this one
+                with timer.phase('budget'):
+                    controller.observe(workers.block, server.err, server.nbytes)
+            if metrics is not None: # loss stays a tensor, it is read on the writer thread
+                metrics.step(epoch, k, loss=loss.detach(), step_time=metrics.timer(), bytes=server.nbytes)
+            tracer.step()
             iter += 1
             
             if k % 10 == 0:
                 print('Train Epoch: {} [{}/{} ({:.0f}%)]\tLoss: {:.6f}'.format(
-                    epoch, k * b_sz * 10, 60000,
-                    100. * k * b_sz * 10 / 60000, loss.item()))
-
-        [aloss,anacc] = test(model, device, Xtest, ytest, b_sz_test)
+                    epoch, k * b_sz * 10, n_train,
+                    100. * k * b_sz * 10 / n_train, loss.item()))
+
+        tests += [evaluator.submit(model)] # test on a snapshot in the background, training goes on
+        commbytes += [epochbytes/iter_per_epoch]
+        if metrics is not None:
+            metrics.epoch(epoch, bytes=commbytes[-1], test=tests[-1])
+        if timer.enabled:
+            print(timer.summary() + '\n')
+        if controller is not None:
+            print(controller.summary())
+        print('Bytes per round: {:.0f} ({:.1f}% of dense float32)\n'.format(
+            commbytes[-1], 100. * commbytes[-1] / (20*4*sum(p.numel() for p in model.parameters()))))
+        if checkpointer is not None and checkpointer.due(epoch):
+            checkpointer.save({'epoch': epoch, 'iter': iter, 'model': model.state_dict(),
+                               'workers': workers.block, 'server': server.err, 'rng': rng_state(),
+                               'tests': tests, 'commbytes': commbytes,
+                               'controller': controller.state_dict() if controller is not None else None,
+                               'metrics': metrics.flush() if metrics is not None else None})
+    for aloss, anacc in resolve(tests): # in epoch order
         testloss += [aloss]
         testacc += [anacc]
-    return(testloss,testacc)
+    tracer.close()
+    if pipeline is not None:
+        pipeline.close()
+    evaluator.close()
+    if checkpointer is not None:
+        checkpointer.close()
+    return(testloss,testacc,commbytes)
+
+
+def sweep_run(b_sz, lr, sfactor=None, epochs=10, metrics=None, checkpoint=None, timers=False, profile=None,
+              budget=None, batched=False, **data):
+    # one configuration of the sweep, with a fixed sfactor or a budget of bytes per round;
+    # profile is a directory for its Chrome trace
+    if profile is not None:
+        config = dict(b_sz=b_sz, lr=lr, sfactor=sfactor, epochs=epochs) if budget is None else \
+                 dict(b_sz=b_sz, lr=lr, budget=budget, epochs=epochs)
+        profile = os.path.join(profile, result_name(config)[:-len('.csv')] + '.json')
+    main(b_sz, lr, sfactor, batched=batched, maxepoch=epochs, checkpoint=checkpoint, metrics=metrics, timers=timers,
+         profile=profile, budget=budget, **data)
+
+
+def main_distributed(b_sz, sfactor, value_dtype=torch.float32, maxepoch=10, scheme='class', alpha=0.5,
+                     synthetic=None, model_size=None, pipelined=False, bucket_bytes=None):
+    # one process per local server plus the central server (rank 0), launched with
+    #   torchrun --standalone --nproc_per_node=11 "Error-compensated compressed SGD with top-s sparsification for FashionMNIST.py"
+    # the central step size is alpha0/sqrt(iter) as in main, there is no learning rate to set
+    rank, world = parameter_server.init_process_group()
+    torch.manual_seed(20200930) # identical initial model on every rank
+    device = torch.device("cpu")
+
+    if rank != 0: # let the central server download FashionMNIST first
+        dist.barrier()
+    local_Xtrain, local_ytrain, Xtest, ytest = load_data(scheme, world - 1, alpha, synthetic, b_sz) # one shard per local server
+    if rank == 0:
+        dist.barrier()
+
+    model = Net_FC(input_shape=tuple(Xtest.shape[1:]), num_classes=synthetic_data.num_classes(synthetic),
+                   **(model_size or {})).to(device)
+    alpha0 = 1
+    history = parameter_server.train(model, local_Xtrain, local_ytrain, b_sz,
+                                     lambda v: sparsify_payload(v,sfactor,value_dtype), # compress into (index, value) pairs
+                                     lambda iter: alpha0/(iter**0.5), # use step size for vanilla SGD
+                                     sum(len(y) for y in local_ytrain)//((world - 1)*b_sz), maxepoch,
+                                     lambda model: test(model, device, Xtest, ytest, len(ytest)), pipelined=pipelined,
+                                     bucket_bytes=bucket_bytes)
+    dist.destroy_process_group()
+    return history
 
         
 if __name__ == '__main__':
-
-    #lr = 0.01, batch size = 5, s = 0.1n, epochs = 10
-    testloss, testacc = main(5,1e-2,0.1)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.1,lr=0.01,bsztest=5.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 5, s = 0.2n, epochs = 10
-    testloss, testacc = main(5,1e-2,0.2)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.2,lr=0.01,bsztest=5.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 5, s = 0.5n, epochs = 10
-    testloss, testacc = main(5,1e-2,0.5)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.5,lr=0.01,bsztest=5.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 5, s = 0.8n, epochs = 10
-    testloss, testacc = main(5,1e-2,0.8)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.8,lr=0.01,bsztest=5.csv'
-    df.to_csv(filename)
-    
-    #lr = 0.01, batch size = 10, s = 0.1n, epochs = 10
-    testloss, testacc = main(10,1e-2,0.1)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.1,lr=0.01,bsztest=10.csv'
-    df.to_csv(filename)
-    
-    #lr = 0.01, batch size = 10, s = 0.2n, epochs = 10
-    testloss, testacc = main(10,1e-2,0.2)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.2,lr=0.01,bsztest=10.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 10, s = 0.5n, epochs = 10
-    testloss, testacc = main(10,1e-2,0.5)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.5,lr=0.01,bsztest=10.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 10, s = 0.8n, epochs = 10
-    testloss, testacc = main(10,1e-2,0.8)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.8,lr=0.01,bsztest=10.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 20, s = 0.1n, epochs = 10
-    testloss, testacc = main(20,1e-2,0.1)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.1,lr=0.01,bsztest=20.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 20, s = 0.2n, epochs = 10
-    testloss, testacc = main(20,1e-2,0.2)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.2,lr=0.01,bsztest=20.csv'
-    df.to_csv(filename)
-    
-    #lr = 0.01, batch size = 20, s = 0.5n, epochs = 10
-    testloss, testacc = main(20,1e-2,0.5)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.5,lr=0.01,bsztest=20.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 20, s = 0.8n, epochs = 10
-    testloss, testacc = main(20,1e-2,0.8)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.8,lr=0.01,bsztest=20.csv'
-    df.to_csv(filename)
-
-    
-    #lr = 0.01, batch size = 10, s = 0.5n, epochs = 30
-    testloss, testacc = main(10,1e-2,0.5)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.5,lr=0.01,bsztest=10,epochs=30.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 10, s = 0.8n, epochs = 30
-    testloss, testacc = main(10,1e-2,0.8)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.8,lr=0.01,bsztest=10,epochs=30.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 5, s = 0.5n, epochs = 30
-    testloss, testacc = main(5,1e-2,0.5)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.5,lr=0.01,bsztest=5,epochs=30.csv'
-    df.to_csv(filename)
-
-    #lr = 0.01, batch size = 5, s = 0.8n, epochs = 30
-    testloss, testacc = main(5,1e-2,0.8)
-    results = [testloss, testacc]
-    labels = ['test loss', 'prediction accuracy']
-    thedict = {}
-    for i in range(0,len(results)):
-        thedict[labels[i]] = [str(item) for item in results[i]]
-    df = pd.DataFrame(thedict)
-    filename = 'b=0.8,lr=0.01,bsztest=5,epochs=30.csv'
-    df.to_csv(filename)
+    if 'RANK' in os.environ: # launched by torchrun, run a single configuration across processes
+        parser = argparse.ArgumentParser(description='Error-compensated compressed SGD with top-s sparsification, multi-process')
+        parser.add_argument('--batch-size', type=int, default=10, metavar='N',
+                            help='batch size on each local server (default: 10)')
+        parser.add_argument('--sfactor', type=float, default=0.1, metavar='S',
+                            help='fraction of entries kept by top-s (default: 0.1)')
+        parser.add_argument('--fp16', action='store_true', default=False,
+                            help='send kept values as float16')
+        parser.add_argument('--epochs', type=int, default=10, metavar='N',
+                            help='number of epochs to train (default: 10)')
+        parser.add_argument('--partition', default='class', choices=SCHEMES,
+                            help='split of the training set across local servers (default: class)')
+        parser.add_argument('--alpha', type=float, default=0.5, metavar='A',
+                            help='concentration of the dirichlet partition (default: 0.5)')
+        parser.add_argument('--pipelined', action='store_true', default=False,
+                            help='compress each layer on a thread as soon as backward has produced its gradient')
+        synthetic_data.add_arguments(parser)
+        error_feedback.add_arguments(parser)
+        args = parser.parse_args()
+        main_distributed(args.batch_size, args.sfactor,
+                         torch.float16 if args.fp16 else torch.float32, args.epochs, args.partition, args.alpha,
+                         *synthetic_data.settings(args), pipelined=args.pipelined,
+                         bucket_bytes=error_feedback.bucket_size(args))
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description='Error-compensated compressed SGD with top-s sparsification, sweep')
+    parser.add_argument('--processes', type=int, default=None, metavar='N',
+                        help='parallel training runs (default: number of cores / threads)')
+    parser.add_argument('--threads', type=int, default=1, metavar='N',
+                        help='torch threads per training run (default: 1)')
+    parser.add_argument('--timers', action='store_true', default=False,
+                        help='print the time spent in each phase of a round every epoch')
+    parser.add_argument('--profile', default=None, metavar='DIR',
+                        help='write a Chrome trace of rounds 10-14 of every run to DIR')
+    parser.add_argument('--batched', action='store_true', default=False,
+                        help='compute and compress the gradients of all local servers in one batched call')
+    parser.add_argument('--pipelined', action='store_true', default=False,
+                        help='compress each layer on a thread as soon as backward has produced its gradient')
+    parser.add_argument('--budget', type=int, default=None, metavar='BYTES',
+                        help='one adaptive run per batch size at BYTES per round instead of the sfactor grid')
+    synthetic_data.add_arguments(parser)
+    error_feedback.add_arguments(parser)
+    args = parser.parse_args()
+    if args.batched and args.pipelined:
+        parser.error('--pipelined hooks the sequential backward passes, it cannot be combined with --batched')
+    synthetic, model_size = synthetic_data.settings(args)
+    if args.profile is not None:
+        os.makedirs(args.profile, exist_ok=True)
+
+    if synthetic is None:
+        fmnist_cache.build(download=True) # download and convert once before forking the sweep
+    else: # generate once before forking the sweep
+        load_data(synthetic=synthetic)
+
+    # lr = 0.01, batch size = 5, 10, 20, s = 0.1n, 0.2n, 0.5n, 0.8n, epochs = 10,
+    # then the longer runs with batch size = 10, 5, s = 0.5n, 0.8n, epochs = 30
+    configs = grid(b_sz=[5, 10, 20], lr=[1e-2], sfactor=[0.1, 0.2, 0.5, 0.8], epochs=[10]) + \
+              grid(b_sz=[10, 5], lr=[1e-2], sfactor=[0.5, 0.8], epochs=[30])
+    if args.budget is not None: # sfactor of every bucket chosen on the fly
+        configs = grid(b_sz=[5, 10, 20], lr=[1e-2], budget=[args.budget], epochs=[10])
+    run_sweep(functools.partial(sweep_run, timers=args.timers, profile=args.profile, batched=args.batched,
+                                synthetic=synthetic, model_size=model_size, pipelined=args.pipelined,
+                                bucket_bytes=error_feedback.bucket_size(args)),
+              configs, processes=args.processes, threads_per_process=args.threads,
+              table='top-s sweep results.csv', checkpoint=True)
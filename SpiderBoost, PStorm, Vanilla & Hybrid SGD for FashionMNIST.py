@@ -1,281 +1,100 @@
 from __future__ import print_function
 import argparse
+import functools
+import os
 import torch
-import torch.nn as nn
 import torch.nn.functional as F
-import torch.optim as optim
-from torchvision import datasets, transforms
-import pandas as pd
-
-class LeNet5(nn.Module):
-    def __init__(self):
-        super(LeNet5, self).__init__()
-        self.conv1 = nn.Conv2d(1, 6, 5, 1)
-        self.conv2 = nn.Conv2d(6, 16, 5, 1)
-        self.fc1 = nn.Linear(256, 120)
-        self.fc2 = nn.Linear(120,84)
-        self.fc3 = nn.Linear(84,10)
-
-    def forward(self, x):
-        x = F.relu(self.conv1(x))
-        x = F.max_pool2d(x, 2, 2)
-        x = F.relu(self.conv2(x))
-        x = F.max_pool2d(x, 2, 2)
-        x = x.view(-1, 256)
-        x = F.relu(self.fc1(x))
-        x = F.relu(self.fc2(x))
-        x = self.fc3(x)
-        return F.log_softmax(x, dim=1)
-
-
-
-class LeNet5_smooth(nn.Module):
-    def __init__(self):
-        super(LeNet5_smooth, self).__init__()
-        self.conv1 = nn.Conv2d(1, 6, 5, 1)
-        self.conv2 = nn.Conv2d(6, 16, 5, 1)
-        self.fc1 = nn.Linear(256, 120)
-        self.fc2 = nn.Linear(120,84)
-        self.fc3 = nn.Linear(84,10)
-
-    def forward(self, x):
-        x = F.tanh(self.conv1(x))
-        x = F.max_pool2d(x, 2, 2)
-        x = F.tanh(self.conv2(x))
-        x = F.max_pool2d(x, 2, 2)
-        x = x.view(-1, 256)
-        x = F.tanh(self.fc1(x))
-        x = F.tanh(self.fc2(x))
-        x = self.fc3(x)
-        return F.log_softmax(x, dim=1)
-
-
-        
-class Net_FC(nn.Module):
-    def __init__(self):
-        super(Net_FC, self).__init__()
-        self.fc1 = nn.Linear(784, 500)
-        self.fc2 = nn.Linear(500, 10)
-        
-    def forward(self, x):
-        x = x.view(-1, 784)
-        x = F.relu(self.fc1(x))
-        x = self.fc2(x)
-        return F.log_softmax(x, dim=1)
-
-
-def train(args, model, device, train_loader, optimizer, epoch, lr,\
-          gradlist, updatelist, outputlist, iter, opttype):
+import fmnist_cache
+from fmnist_cache import TensorLoader
+import synthetic as synthetic_data
+from models import LeNet5_smooth, num_params
+from async_eval import AsyncEvaluator
+from checkpoint import Checkpointer, rng_state, set_rng_state, resolve
+from sweep import grid, run_sweep
+from prox import ViolationMonitor
+from optimizers import OPTIMIZERS
+from batched_grads import grouped_grads, two_point_grads
+from instrument import DISABLED, PhaseTimer, Tracer
+
+
+def train(args, model, device, train_loader, optimizer, monitor, epoch, other_loader=None, metrics=None, timer=DISABLED,
+          tracer=None):
     model.train()
+    monitor.reset()
+    if metrics is not None:
+        metrics.timer()
+    others = iter(other_loader) if other_loader is not None else None
     for batch_idx, (data, target) in enumerate(train_loader):
         data, target = data.to(device), target.to(device)
-        output = model(data)
-        loss = F.nll_loss(output, target)
-        loss.backward()
-
-        # Hybrid-SGD
-        if opttype == 'Hybrid-SGD':
-            
-            def aclosure(): # Get gradients from separate sample
+        if others is not None: # Hybrid-SGD: second gradient from an independent minibatch
+            other = next(others, None)
+            if other is None: # independent stream exhausted, reshuffle
+                others = iter(other_loader)
+                other = next(others)
+            odata, otarget = other[0].to(device), other[1].to(device)
+            if args.batched:
+                n = min(len(data), len(odata))
+                # both minibatches through the model in one batched call, stacked as [2, n, ...]
+                with timer.phase('forward+backward'):
+                    grads, losses = grouped_grads(model, torch.stack([data[:n], odata[:n]]),
+                                                  torch.stack([target[:n], otarget[:n]]))
+                for name, p in model.named_parameters():
+                    p.grad = grads[name][0]
+                loss = losses[0]
+                othergrad = [grads[name][1] for name, _ in model.named_parameters()]
+            else:
                 optimizer.zero_grad()
+                with timer.phase('forward'):
+                    oloss = F.nll_loss(model(odata), otarget)
+                with timer.phase('backward'):
+                    oloss.backward()
+                othergrad = [p.grad for p in model.parameters()]
+                optimizer.zero_grad() # grads are set to None, othergrad stays intact
+                with timer.phase('forward'):
+                    loss = F.nll_loss(model(data), target)
+                with timer.phase('backward'):
+                    loss.backward()
+            with timer.phase('optimizer'): # update and proximal mapping, fused
+                optimizer.step(other_grads=othergrad)
+        elif optimizer.prev_params() is not None: # SpiderBoost, PStorm with --two-point
+            # gradients at the current and the previous iterate on this minibatch, in one call
+            with timer.phase('forward+backward'):
+                grads, prevgrads, losses = two_point_grads(model, optimizer.prev_params(), data, target,
+                                                           batched=args.batched)
+            for p, agrad in zip(model.parameters(), grads):
+                p.grad = agrad
+            loss = losses[0]
+            with timer.phase('optimizer'):
+                optimizer.step(prev_grads=prevgrads)
+        else:
+            optimizer.zero_grad()
+            with timer.phase('forward'):
                 output = model(data)
                 loss = F.nll_loss(output, target)
+            with timer.phase('backward'):
                 loss.backward()
-                othergrad = []
-                for p in model.parameters(): # Store gradients in list
-                    othergrad = othergrad + [p.grad]
-                return othergrad
-            othergrad = aclosure()
-            
-            L = 2 # Approximate Lipschitz constant
-            B0 = args.batch_size**0.5
-            gamma = 0.95
-            eta = 0.25
-            beta = 1 - 1/((B0*(iter + 1))**0.5)
-            player = 0 # Counter to keep track of layer in network
-            for p in model.parameters():
-                if iter == 1: # Store gradient and x at this iteration
-                    gradlist = grad_list(gradlist, p.grad, player)
-                    outputlist = output_list(outputlist, p.data, player)
-                    p.grad.mul_(1/B0) # Store v at this iteration
-                    updatelist = update_list(updatelist, p.grad, player)
-                    p.grad.mul_(-eta)
-                    p.data.add_(p.grad) # Update x
-                else: # Get gradient and v at previous iteration
-                    v0 = updatelist[player][-1].clone()
-                    grad0 = gradlist[player][-1].clone()
-                    gradlist = grad_list(gradlist, p.grad, player) 
-                    v0.mul_(beta)
-                    grad0.mul_(beta)
-                    anothergrad = othergrad[player].clone()
-                    anothergrad.mul_(1 - beta)
-                    p.grad.mul_(beta)
-                    p.grad.add_(v0 - grad0)
-                    updatelist = update_list(updatelist, p.grad, player)
-                    p.grad.mul_(-eta)
-                    p.data.add_(p.grad) # Update x
-
-                # Proximal mapping of (x - eta*gradient) onto eta*r    
-                temp_tensor = p.data.clone()
-                top_tensor = temp_tensor[temp_tensor > lr*eta]
-                mid_tensor = temp_tensor[temp_tensor.abs() <= lr*eta]
-                low_tensor = temp_tensor[temp_tensor < -lr*eta]
-                top_tensor.add_(-lr*eta)
-                mid_tensor = 0
-                low_tensor.add_(lr*eta)
-                p.data[p.data > lr*eta] = top_tensor
-                p.data[p.data.abs() <= lr*eta] = mid_tensor
-                p.data[p.data < -lr*eta] = low_tensor
-
-                # Add (1 - gamma)*(x at previous iteration) to mapping
-                p.data.mul_(gamma)
-                old_tensor = outputlist[player][-1].clone() # x at previous iteration
-                old_tensor.mul_(1 - gamma)
-                p.data.add_(old_tensor) # Update x
-                outputlist = output_list(outputlist, p.data, player)    
-                player += 1 # Update layer counter before moving onto next layer
-
-        # SpiderBoost
-        elif opttype == 'SpiderBoost':
-            L = 2
-            eta = 1/(2*L)
-            S = args.batch_size**0.5
-            player = 0
-            for p in model.parameters():
-                if iter == 1:
-                    gradlist = grad_list(gradlist, p.grad, player)
-                    p.grad.mul_(1/S)
-                    updatelist = update_list(updatelist, p.grad, player)
-                    p.grad.mul(-eta)
-                    p.data.add_(p.grad)
-                else:
-                    grad0 = gradlist[player][-1].clone()
-                    v0 = updatelist[player][-1].clone()
-                    gradlist = grad_list(gradlist, p.grad, player)
-                    p.grad.add_(v0 - grad0)
-                    p.grad.mul_(1/S)
-                    updatelist = update_list(updatelist, p.grad, player)
-                    p.grad.mul_(-eta)
-                    p.data.add_(p.grad)
-    
-                temp_tensor = p.data.clone()
-                top_tensor = temp_tensor[temp_tensor > lr*eta]
-                mid_tensor = temp_tensor[temp_tensor.abs() <= lr*eta]
-                low_tensor = temp_tensor[temp_tensor < -lr*eta]
-                top_tensor.add_(-lr*eta)
-                mid_tensor = 0
-                low_tensor.add_(lr*eta)
-                p.data[p.data > lr*eta] = top_tensor
-                p.data[p.data.abs() <= lr*eta] = mid_tensor
-                p.data[p.data < -lr*eta] = low_tensor
-                player += 1
-
-        # PStorm
-        elif opttype == 'PStorm':
-            B0 = args.batch_size**0.5
-            L = 2
-            eta0 = (4**1/3)/(8*L)
-            eta = eta0/((iter + 4)**(1/3))
-            eta1 = eta0/((iter + 4 + 1)**(1/3))
-            beta = (1 + (20*(eta*L)**2) - (eta1/eta))/(1 + 4*(eta*iter)**2)
-            player = 0
-            for p in model.parameters():
-                if iter == 1:
-                    gradlist = grad_list(gradlist, p.grad, player)
-                    p.grad.mul_(1/B0)
-                    updatelist = update_list(updatelist, p.grad, player)
-                    p.grad.mul_(-eta)
-                    p.data.add_(p.grad)
-                else:
-                    grad0 = gradlist[player][-1].clone()
-                    d0 = updatelist[player][-1].clone()
-                    grad0.mul_((1 - beta)/B0)
-                    d0.mul_(1 - beta)
-                    gradlist = grad_list(gradlist, p.grad, player)
-                    p.grad.mul_(1/B0)
-                    p.grad.add_(d0 - grad0)
-                    updatelist = update_list(updatelist, p.grad, player)
-                    p.grad.mul_(-eta)
-                    p.data.add_(p.grad)
-                    
-                temp_tensor = p.data.clone()
-                top_tensor = temp_tensor[temp_tensor > lr*eta]
-                mid_tensor = temp_tensor[temp_tensor.abs() <= lr*eta]
-                low_tensor = temp_tensor[temp_tensor < -lr*eta]
-                top_tensor.add_(-lr*eta)
-                mid_tensor = 0
-                low_tensor.add_(lr*eta)
-                p.data[p.data > lr*eta] = top_tensor
-                p.data[p.data.abs() <= lr*eta] = mid_tensor
-                p.data[p.data < -lr*eta] = low_tensor
-                player += 1
-
-        # Vanilla SGD
-        elif opttype == 'Vanilla-SGD':
-            alpha0 = 1
-            for p in model.parameters():        
-                p.grad.mul_(-alpha0/(iter**0.5))
-                p.data.add_(p.grad)
-
-            temp_tensor = p.data.clone()
-            top_tensor = temp_tensor[temp_tensor > lr*alpha0]
-            mid_tensor = temp_tensor[temp_tensor.abs() <= lr*alpha0]
-            low_tensor = temp_tensor[temp_tensor < -lr*alpha0]
-            top_tensor.add_(-lr*alpha0)
-            mid_tensor = 0
-            low_tensor.add_(lr*alpha0)
-            p.data[p.data > lr*alpha0] = top_tensor
-            p.data[p.data.abs() <= lr*alpha0] = mid_tensor
-            p.data[p.data < -lr*alpha0] = low_tensor
-
-        # Violation of stationarity
-        viol = 0
-        for param in model.parameters():
-            if lr == 0: # Violation = norm(grad) 
-                viol += torch.norm(param.grad) # Sum over each layer
-            else: # Violation = norm((proximal mapping of (x - grad) onto r) - x)
-                themap = param.data - param.grad # x - grad
-                temp_map = themap.clone()
-                # Compute proximal mapping of (x - grad) onto r
-                top_tensor = temp_map[temp_map > lr]
-                mid_tensor = temp_map[temp_map.abs() <= lr]
-                low_tensor = temp_map[temp_map < -lr]
-                top_tensor.add_(-lr)
-                mid_tensor = 0
-                low_tensor.add_(lr)
-                temp_map[temp_map > lr] = top_tensor
-                temp_map[temp_map.abs() <= lr] = mid_tensor
-                temp_map[temp_map < -lr] = low_tensor 
-                viol += torch.norm(temp_map - param.data) # Sum over each layer        
-        
-        optimizer.zero_grad()        
-        iter += 1
+            with timer.phase('optimizer'):
+                optimizer.step() # update x and take the proximal mapping onto r, see optimizers.py
+
+        # Violation of stationarity, measured every args.viol_every steps
+        measured = monitor.steps % monitor.every == 0
+        with timer.phase('violation'):
+            viol = monitor.step()
+        if metrics is not None: # loss stays a tensor, it is read on the writer thread
+            metrics.step(epoch, batch_idx, loss=loss.detach(), violation=viol if measured else None,
+                         step_time=metrics.timer())
+        if tracer is not None:
+            tracer.step()
 
         if batch_idx % args.log_interval == 0:
             print('Train Epoch: {}, Violation: {:.6f}, [{}/{} ({:.0f}%)]\tLoss: {:.6f}'.format(
                 epoch, viol, batch_idx * len(data), len(train_loader.dataset),
                 100. * batch_idx / len(train_loader), loss.item()))
 
-        if batch_idx*len(data) >= 57600:
-            return viol.item() # Return final violation of epoch
-
-
-# Each nested list holds gradients over all iterations at each layer
-def grad_list(alist, agrad, alayer): 
-    alist[alayer] = alist[alayer] + [agrad]
-    return alist
-
-
-# Each nested list holds update directions over all iterations at each layer
-def update_list(alist, anupdate, alayer):
-    alist[alayer] = alist[alayer] + [anupdate]
-    return alist
-
-
-# Each nested list holds x over all iterations at each layer
-def output_list(alist, anoutput, alayer):
-    alist[alayer] = alist[alayer] + [anoutput]
-    return alist
+        if batch_idx*args.batch_size >= args.train_stop: # samples seen so far, a partial last batch included
+            break
+    with timer.phase('violation'):
+        return monitor.measure() # Return final violation of epoch
 
 
 def test(args, model, device, test_loader):
@@ -300,14 +119,12 @@ def test(args, model, device, test_loader):
     return(test_loss, 100. * correct / len(test_loader.dataset))
 
 
-def main(opttype, lr): # pass in optimization algorithm and learning rate
-    # Training settings
-
+def make_parser():
     parser = argparse.ArgumentParser(description='MNIST Example')
     parser.add_argument('--batch-size', type=int, default=64, metavar='N', \
                         help='input batch size for training (default: 64)')
-    parser.add_argument('--test-batch-size', type=int, default=1000, metavar='N', \
-                        help='input batch size for testing (default: 1000)')
+    parser.add_argument('--test-batch-size', type=int, default=10000, metavar='N', \
+                        help='input batch size for testing (default: 10000)')
     parser.add_argument('--epochs', type=int, default=75, metavar='N', \
                         help='number of epochs to train (default: 50 or 75)')
     parser.add_argument('--seed', type=int, default=20200930, metavar='N', \
@@ -316,7 +133,36 @@ def main(opttype, lr): # pass in optimization algorithm and learning rate
                         help='how many batches to wait before logging training status')
     parser.add_argument('--save-model', action='store_true', default=False, \
                         help='for saving the current model')
-    args = parser.parse_args()
+    parser.add_argument('--processes', type=int, default=None, metavar='N', \
+                        help='parallel training runs in the sweep (default: number of cores / threads)')
+    parser.add_argument('--threads', type=int, default=1, metavar='N', \
+                        help='torch threads per training run (default: 1)')
+    parser.add_argument('--compile', action='store_true', default=False, \
+                        help='run the optimizer updates through torch.compile')
+    parser.add_argument('--batched', action='store_true', default=False, \
+                        help='compute two gradients per step (Hybrid-SGD, --two-point) in one batched call')
+    parser.add_argument('--two-point', action='store_true', default=False, \
+                        help='SpiderBoost and PStorm difference gradients at both iterates on the same minibatch')
+    parser.add_argument('--viol-every', type=int, default=None, metavar='N', \
+                        help='steps between violation measurements (default: log interval)')
+    parser.add_argument('--timers', action='store_true', default=False, \
+                        help='print the time spent in each phase of a step every epoch')
+    parser.add_argument('--profile', default=None, metavar='DIR', \
+                        help='write a Chrome trace of steps 10-14 of every run to DIR')
+    synthetic_data.add_arguments(parser)
+    return parser
+
+
+def main(opttype, lr, batch_size=64, test_batch_size=10000, epochs=75, seed=20200930, log_interval=200,
+         compile=False, batched=False, two_point=False, viol_every=None, checkpoint=None, checkpoint_every=1,
+         metrics=None, timers=False, profile=None, profile_start=10, profile_steps=5, synthetic=None, model_size=None):
+    # synthetic: settings of synthetic.load to train on instead of FashionMNIST, 'stream' to generate the
+    # minibatches on the fly; model_size: width and depth of LeNet5_smooth
+    # pass in optimization algorithm, learning rate and training settings
+    args = argparse.Namespace(batch_size=batch_size, test_batch_size=test_batch_size,
+                              epochs=epochs, seed=seed, log_interval=log_interval,
+                              compile=compile, batched=batched, two_point=two_point,
+                              viol_every=viol_every or log_interval)
     
     use_cuda = False
 
@@ -324,173 +170,120 @@ def main(opttype, lr): # pass in optimization algorithm and learning rate
 
     device = torch.device("cuda" if use_cuda else "cpu")
 
-    kwargs = {'num_workers': 1, 'pin_memory': True} if use_cuda else {}
-    train_loader = torch.utils.data.DataLoader(
-        datasets.FashionMNIST('data', train=True, download=True,
-                       transform=transforms.Compose([
-                           transforms.ToTensor(),
-                           transforms.Normalize((0.1307,), (0.3081,))
-                       ])),
-        batch_size=args.batch_size, shuffle=True, **kwargs)
-    test_loader = torch.utils.data.DataLoader(
-        datasets.FashionMNIST('data', train=False, transform=transforms.Compose([
-                           transforms.ToTensor(),
-                           transforms.Normalize((0.1307,), (0.3081,))
-                       ])),
-        batch_size=args.test_batch_size, shuffle=True, **kwargs)
+    # normalized arrays memory-mapped from the local cache, downloaded and converted on first use,
+    # minibatches by tensor indexing
+    Xtest, ytest = synthetic_data.dataset(train=False, synthetic=synthetic, download=True)
+    test_loader = TensorLoader(Xtest, ytest, args.test_batch_size, shuffle=False)
+    other_loader = None
+    if synthetic is not None and synthetic.get('stream'): # nothing stored, fresh minibatches every epoch
+        train_loader = synthetic_data.stream_loader(args.batch_size, synthetic)
+        if opttype == 'Hybrid-SGD':
+            other_loader = synthetic_data.stream_loader(args.batch_size, synthetic, stream=1)
+    else:
+        Xtrain, ytrain = synthetic_data.dataset(train=True, synthetic=synthetic, download=True)
+        train_loader = TensorLoader(Xtrain, ytrain, args.batch_size, shuffle=True)
+        if opttype == 'Hybrid-SGD': # independently shuffled stream of the training set for the second gradient
+            other_loader = TensorLoader(Xtrain, ytrain, args.batch_size, shuffle=True, drop_last=True,
+                                        generator=torch.Generator().manual_seed(args.seed + 1))
+    args.train_stop = len(train_loader.dataset)*24//25 # 57600 of the 60000 FashionMNIST images
     
-    model = LeNet5_smooth().to(device)
-
-    optimizer = optim.SGD(model.parameters(), lr)
-
-    # Initialize lists to store data
-    gradlist = [[], [], [], [], [], [], [],[],[],[]]
-    updatelist = [[], [], [], [], [], [], [],[],[],[]]
-    outputlist = [[], [], [], [], [], [], [],[],[],[]]
+    model = LeNet5_smooth(input_shape=tuple(Xtest.shape[1:]), num_classes=synthetic_data.num_classes(synthetic),
+                          **(model_size or {})).to(device)
+    if synthetic is not None or model_size:
+        print('{} parameters'.format(num_params(model)))
+
+    if opttype == 'Vanilla-SGD':
+        optimizer = OPTIMIZERS[opttype](model.parameters(), lr, compile=args.compile)
+    elif opttype == 'Hybrid-SGD':
+        optimizer = OPTIMIZERS[opttype](model.parameters(), lr, args.batch_size, compile=args.compile)
+    else:
+        optimizer = OPTIMIZERS[opttype](model.parameters(), lr, args.batch_size, compile=args.compile,
+                                        two_point=args.two_point)
+
+    monitor = ViolationMonitor(model.parameters(), lr, every=args.viol_every)
     violist = []
     losslist = []
     acclist = []
-    
-    iter = 1
+
+    # test on weight snapshots in the background while the next epoch trains
+    evaluator = AsyncEvaluator(model, lambda model: test(args, model, device, test_loader))
+
+    tests = [] # test result of each epoch, pending ones as futures
+    start_epoch = 0
+    checkpointer = Checkpointer(checkpoint, checkpoint_every) if checkpoint is not None else None
+    state = checkpointer.load() if checkpointer is not None else None
+    if state is not None: # resume right after the last checkpointed epoch
+        model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        set_rng_state(state['rng'])
+        if other_loader is not None:
+            other_loader.generator.set_state(state['other_rng'])
+        if state.get('train_rng') is not None: # minibatch stream of synthetic data generated on the fly
+            train_loader.generator.set_state(state['train_rng'])
+        violist = state['violist']
+        tests = state['tests']
+        start_epoch = state['epoch'] + 1
+        if metrics is not None and state['metrics'] is not None: # drop the rows logged after the checkpoint
+            metrics.rewind(state['metrics'])
+        print('Resuming {} from {} after epoch {}'.format(opttype, checkpoint, state['epoch']))
+    elif metrics is not None and checkpointer is not None: # no checkpoint yet, rows of an earlier attempt start over
+        metrics.rewind(0)
+
+    timer = PhaseTimer(timers, record=profile is not None) # per-epoch breakdown of a step
+    tracer = Tracer(profile, profile_start, profile_steps) # Chrome trace of a window of steps
 
     # Store violation, average test loss, testing acccuracy at each epoch
-    for epoch in range(args.epochs + 1):
+    for epoch in range(start_epoch, args.epochs + 1):
+        timer.reset()
         violist = violist + \
-        [train(args, model, device, train_loader, optimizer, epoch, lr,\
-              gradlist, updatelist, outputlist, iter, opttype)]
-        aloss, anacc = test(args, model, device, test_loader)
+        [train(args, model, device, train_loader, optimizer, monitor, epoch, other_loader, metrics, timer, tracer)]
+        if timer.enabled:
+            print(timer.summary() + '\n')
+        tests = tests + [evaluator.submit(model)]
+        if metrics is not None:
+            metrics.epoch(epoch, violation=violist[-1], test=tests[-1])
+        if checkpointer is not None and checkpointer.due(epoch):
+            # optimizer state holds the last gradient, direction and previous iterate of the estimators
+            checkpointer.save({'epoch': epoch, 'model': model.state_dict(), 'optimizer': optimizer.state_dict(),
+                               'rng': rng_state(),
+                               'other_rng': other_loader.generator.get_state() if other_loader is not None else None,
+                               'train_rng': train_loader.generator.get_state()
+                                            if getattr(train_loader, 'generator', None) is not None else None,
+                               'violist': violist, 'tests': tests,
+                               'metrics': metrics.flush() if metrics is not None else None})
+    for aloss, anacc in resolve(tests): # in epoch order
         losslist = losslist + [aloss]
         acclist = acclist + [anacc]
-        iter += 60000//args.batch_size
+    tracer.close()
+    evaluator.close()
+    if checkpointer is not None:
+        checkpointer.close()
     return (losslist, acclist, violist) # Return lists
         
-if __name__ == '__main__':
-    # Labels for results
-    labels_sb = ['sb_l', 'sb_a', 'sb_v']
-    labels_ps = ['ps_l', 'ps_a', 'ps_v']
-    labels_hsgd = ['hsgd_l', 'hsgd_a', 'hsgd_v']
-    labels_vsgd = ['vsgd_l', 'vsgd_a', 'vsgd_v']
-
-    # Get results from all 4 algorithms at lr = 1e-4
-    loss_sb, acc_sb, viol_sb = main('SpiderBoost', 1e-4)
-    results = [loss_sb, acc_sb, viol_sb]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_sb[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '1e-4' + 'sb.csv'
-    df.to_csv(filename)
+def sweep_run(opttype, lr, profile=None, **settings): # one configuration of the sweep, logged to settings['metrics']
+    if profile is not None: # a directory, one Chrome trace per configuration
+        profile = os.path.join(profile, '{},lr={}.json'.format(opttype, lr))
+    main(opttype, lr, profile=profile, **settings)
 
-    loss_ps, acc_ps, viol_ps = main('PStorm', 1e-4)
-    results = [loss_ps, acc_ps, viol_ps]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_ps[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '1e-4' + 'ps.csv'
-    df.to_csv(filename)
-    
-    loss_hsgd, acc_hsgd, viol_hsgd = main('Hybrid-SGD', 1e-4)
-    results = [loss_hsgd, acc_hsgd, viol_hsgd]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_hsgd[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '1e-4' + 'hsgd.csv'
-    df.to_csv(filename)
-
-    loss_vsgd, acc_vsgd, viol_vsgd = main('Vanilla-SGD', 1e-4)
-    results = [loss_vsgd, acc_vsgd, viol_vsgd]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_vsgd[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '1e-4' + 'vsgd.csv'
-    df.to_csv(filename)
-    
-    # Get results from all 4 algorithms at lr = 1e-6
-    loss_sb, acc_sb, viol_sb = main('SpiderBoost', 1e-6)
-    results = [loss_sb, acc_sb, viol_sb]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_sb[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '1e-6' + 'sb.csv'
-    df.to_csv(filename)
-
-    loss_ps, acc_ps, viol_ps = main('PStorm', 1e-6)
-    results = [loss_ps, acc_ps, viol_ps]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_ps[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '1e-6' + 'ps.csv'
-    df.to_csv(filename)
-    
-    loss_hsgd, acc_hsgd, viol_hsgd = main('Hybrid-SGD', 1e-6)
-    results = [loss_hsgd, acc_hsgd, viol_hsgd]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_hsgd[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '1e-6' + 'hsgd.csv'
-    df.to_csv(filename)
-
-    loss_vsgd, acc_vsgd, viol_vsgd = main('Vanilla-SGD', 1e-6)
-    results = [loss_vsgd, acc_vsgd, viol_vsgd]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_vsgd[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '1e-6' + 'vsgd.csv'
-    df.to_csv(filename)                        
-
-
-    # Get results from all 4 algorithms at lr = 0
-    loss_sb, acc_sb, viol_sb = main('SpiderBoost', 0)
-    results = [loss_sb, acc_sb, viol_sb]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_sb[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '0' + 'sb.csv'
-    df.to_csv(filename)
-
-    loss_ps, acc_ps, viol_ps = main('PStorm', 0)
-    results = [loss_ps, acc_ps, viol_ps]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_ps[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '0' + 'ps.csv'
-    df.to_csv(filename)
-    
-    loss_hsgd, acc_hsgd, viol_hsgd = main('Hybrid-SGD', 0)
-    results = [loss_hsgd, acc_hsgd, viol_hsgd]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_hsgd[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '0' + 'hsgd.csv'
-    df.to_csv(filename)
-
-    loss_vsgd, acc_vsgd, viol_vsgd = main('Vanilla-SGD', 0)
-    results = [loss_vsgd, acc_vsgd, viol_vsgd]
-    thedict = {}
-    for i in range(0, len(results)):
-        theresult = results[i]
-        thedict[labels_vsgd[i]] = [str(item) for item in theresult]
-    df = pd.DataFrame(thedict)
-    filename = '0' + 'vsgd.csv'
-    df.to_csv(filename)
+        
+if __name__ == '__main__':
+    args = make_parser().parse_args()
+
+    synthetic, model_size = synthetic_data.settings(args)
+    if synthetic is None:
+        fmnist_cache.build(download=True) # download and convert once before forking the sweep
+    else: # generate once before forking the sweep
+        synthetic_data.dataset(train=True, synthetic=synthetic)
+        synthetic_data.dataset(train=False, synthetic=synthetic)
+    if args.profile is not None:
+        os.makedirs(args.profile, exist_ok=True)
+
+    # Get results from all 4 algorithms at lr = 1e-4, 1e-6, 0
+    configs = grid(opttype=['SpiderBoost', 'PStorm', 'Hybrid-SGD', 'Vanilla-SGD'], lr=[1e-4, 1e-6, 0],
+                   batch_size=[args.batch_size], epochs=[args.epochs], seed=[args.seed])
+    run_sweep(functools.partial(sweep_run, test_batch_size=args.test_batch_size, log_interval=args.log_interval,
+                                compile=args.compile, batched=args.batched, two_point=args.two_point,
+                                viol_every=args.viol_every, timers=args.timers, profile=args.profile,
+                                synthetic=synthetic, model_size=model_size),
+              configs, processes=args.processes, threads_per_process=args.threads,
+              table='SpiderBoost sweep results.csv', checkpoint=True)
@@ -0,0 +1,34 @@
+## Evaluation of weight snapshots on a background thread while training continues
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import torch
+
+
+class AsyncEvaluator(object): # test_fn(model) on state_dict snapshots of model, results come back in submission order
+    def __init__(self, model, test_fn, max_workers=1):
+        self.template = copy.deepcopy(model) # replicas of the evaluation threads are copied from it
+        self.test_fn = test_fn
+        self.pool = ThreadPoolExecutor(max_workers)
+        self.local = threading.local()
+        self.futures = []
+
+    def submit(self, model): # snapshot the current weights and return immediately
+        snapshot = {name: t.detach().clone() for name, t in model.state_dict().items()}
+        future = self.pool.submit(self._evaluate, snapshot)
+        self.futures.append(future)
+        return future
+
+    def _evaluate(self, snapshot):
+        if not hasattr(self.local, 'model'):
+            self.local.model = copy.deepcopy(self.template)
+        model = self.local.model
+        model.load_state_dict(snapshot)
+        with torch.inference_mode():
+            return self.test_fn(model)
+
+    def results(self): # results of every submitted snapshot in order, waits for the pending ones
+        return [future.result() for future in self.futures]
+
+    def close(self):
+        self.pool.shutdown(wait=True)
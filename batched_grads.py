@@ -0,0 +1,49 @@
+## Several gradients of one model in a single batched call, using torch.func
+import torch
+import torch.nn.functional as F
+from torch.func import functional_call, grad_and_value, vmap
+
+
+def grouped_grads(model, data, target, loss_fn=F.nll_loss): # gradient of each minibatch in a stack of them
+    # data is [G, B, ...] and target is [G, B]; returns {name: [G, *shape]} gradients and the [G] losses
+    params = {name: p.detach() for name, p in model.named_parameters()}
+    buffers = {name: b.detach() for name, b in model.named_buffers()}
+
+    def compute_loss(params, x, y):
+        return loss_fn(functional_call(model, (params, buffers), (x,)), y)
+
+    return vmap(grad_and_value(compute_loss), in_dims=(None, 0, 0))(params, data, target)
+
+def grouped_flat_grads(model, data, target, out=None, loss_fn=F.nll_loss): # as grouped_grads, flattened to [G, n]
+    grads, losses = grouped_grads(model, data, target, loss_fn)
+    G = data.shape[0]
+    flat = torch.cat([g.view(G, -1) for g in grads.values()], dim=1, out=out)
+    return flat, losses
+
+
+def stacked_grads(model, params, data, target, loss_fn=F.nll_loss): # gradient of one minibatch at a stack of parameter sets
+    # params is {name: [P, *shape]}, P values of every parameter of model; returns {name: [P, *shape]} and the [P] losses
+    buffers = {name: b.detach() for name, b in model.named_buffers()}
+
+    def compute_loss(params, x, y):
+        return loss_fn(functional_call(model, (params, buffers), (x,)), y)
+
+    return vmap(grad_and_value(compute_loss), in_dims=(0, None, None))(params, data, target)
+
+def two_point_grads(model, prev_params, data, target, loss_fn=F.nll_loss, batched=True): # gradients at two iterates, same minibatch
+    # prev_params lists a tensor per parameter, in the order of model.parameters(); returns the gradients at the
+    # current parameters, the gradients at prev_params (both lists in that order) and the [2] losses
+    names = [name for name, _ in model.named_parameters()]
+    if batched: # one vmap'd call over the two stacked parameter sets
+        params = {name: torch.stack([p.detach(), q]) for (name, p), q in zip(model.named_parameters(), prev_params)}
+        grads, losses = stacked_grads(model, params, data, target, loss_fn)
+        return [grads[name][0] for name in names], [grads[name][1] for name in names], losses
+
+    # one graph over both parameter sets and one backward call, the two losses share no parameters
+    current = [p.detach().requires_grad_() for p in model.parameters()]
+    previous = [q.detach().requires_grad_() for q in prev_params]
+    buffers = {name: b.detach() for name, b in model.named_buffers()}
+    losses = torch.stack([loss_fn(functional_call(model, (dict(zip(names, params)), buffers), (data,)), target)
+                          for params in (current, previous)])
+    grads = torch.autograd.grad(losses.sum(), current + previous)
+    return list(grads[:len(names)]), list(grads[len(names):]), losses.detach()
@@ -0,0 +1,69 @@
+## Resident memory and step cost of the optimizer state over many epochs
+from __future__ import print_function
+import argparse
+import os
+import sys
+import time
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from optimizers import OPTIMIZERS
+
+# parameter shapes of LeNet5_smooth
+LENET5_SHAPES = [(6, 1, 5, 5), (6,), (16, 6, 5, 5), (16,), (120, 256), (120,),
+                 (84, 120), (84,), (10, 84), (10,)]
+
+
+def rss_mb(): # current resident set size in MB
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description='optimizer state memory check')
+    parser.add_argument('--epochs', type=int, default=75, metavar='N',
+                        help='number of simulated epochs (default: 75)')
+    parser.add_argument('--steps', type=int, default=900, metavar='N',
+                        help='steps per simulated epoch (default: 900)')
+    parser.add_argument('--optimizer', default='Hybrid-SGD', choices=sorted(OPTIMIZERS),
+                        help='optimizer whose state is checked (default: Hybrid-SGD)')
+    parser.add_argument('--tolerance', type=float, default=5., metavar='MB',
+                        help='allowed RSS growth after the first epoch (default: 5 MB)')
+    parser.add_argument('--legacy', action='store_true', default=False,
+                        help='keep every tensor in growing lists, as the scripts used to')
+    args = parser.parse_args()
+
+    params = [torch.nn.Parameter(torch.randn(shape)) for shape in LENET5_SHAPES]
+    for p in params:
+        p.grad = torch.randn(p.shape)
+    if args.legacy:
+        lists = [[] for _ in LENET5_SHAPES]
+    elif args.optimizer == 'Vanilla-SGD':
+        optimizer = OPTIMIZERS[args.optimizer](params, 1e-4)
+    else:
+        optimizer = OPTIMIZERS[args.optimizer](params, 1e-4, 64)
+
+    baseline = None
+    for epoch in range(args.epochs):
+        start = time.perf_counter()
+        for step in range(args.steps):
+            if args.legacy:
+                for layer, p in enumerate(params):
+                    lists[layer] = lists[layer] + [p.grad.clone()]
+            else:
+                optimizer.step()
+        elapsed = time.perf_counter() - start
+        rss = rss_mb()
+        if baseline is None:
+            baseline = rss
+        print('epoch {:3d}  rss {:8.1f} MB  {:6.2f} us/step'.format(
+            epoch, rss, 1e6*elapsed/args.steps))
+
+    growth = rss_mb() - baseline
+    print('RSS growth after first epoch: {:.1f} MB'.format(growth))
+    if not args.legacy and growth > args.tolerance:
+        sys.exit('resident memory grew by {:.1f} MB over {} epochs'.format(growth, args.epochs))
+
+
+if __name__ == '__main__':
+    main()
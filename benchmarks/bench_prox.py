@@ -0,0 +1,98 @@
+## Micro-benchmark of the in-place soft-thresholding against the original six-mask prox code
+from __future__ import print_function
+import argparse
+import os
+import sys
+import time
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prox import soft_threshold_, ViolationMonitor
+
+# parameter shapes of LeNet5_smooth
+LENET5_SHAPES = [(6, 1, 5, 5), (6,), (16, 6, 5, 5), (16,), (120, 256), (120,),
+                 (84, 120), (84,), (10, 84), (10,)]
+
+
+## original implementation, kept here as the reference point
+def prox_legacy(p, t):
+    temp_tensor = p.clone()
+    top_tensor = temp_tensor[temp_tensor > t]
+    mid_tensor = temp_tensor[temp_tensor.abs() <= t]
+    low_tensor = temp_tensor[temp_tensor < -t]
+    top_tensor.add_(-t)
+    mid_tensor = 0
+    low_tensor.add_(t)
+    p[p > t] = top_tensor
+    p[p.abs() <= t] = mid_tensor
+    p[p < -t] = low_tensor
+    return p
+
+
+def violation_legacy(params, lr): # per-step violation as train() originally computed it, three masks per layer
+    viol = 0
+    for param in params:
+        themap = param.data - param.grad # x - grad
+        temp_map = themap.clone()
+        # proximal mapping of (x - grad) onto r
+        top_tensor = temp_map[temp_map > lr]
+        mid_tensor = temp_map[temp_map.abs() <= lr]
+        low_tensor = temp_map[temp_map < -lr]
+        top_tensor.add_(-lr)
+        mid_tensor = 0
+        low_tensor.add_(lr)
+        temp_map[temp_map > lr] = top_tensor
+        temp_map[temp_map.abs() <= lr] = mid_tensor
+        temp_map[temp_map < -lr] = low_tensor
+        viol += torch.norm(temp_map - param.data)
+    return viol
+
+
+def timeit(fn, repeat): # mean wall time of fn over repeat calls
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start)/repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='L1 prox benchmark')
+    parser.add_argument('--tau', type=float, default=1e-4, metavar='T',
+                        help='threshold, lr*eta in the training script (default: 1e-4)')
+    parser.add_argument('--repeat', type=int, default=1000, metavar='N',
+                        help='timed repetitions per shape (default: 1000)')
+    args = parser.parse_args()
+
+    torch.manual_seed(20200930)
+    print('{:>16} {:>8} {:>14} {:>14} {:>9} {:>10}'.format(
+        'shape', 'numel', 'legacy (us)', 'fused (us)', 'speedup', 'max diff'))
+    total_legacy = total_fused = 0
+    for shape in LENET5_SHAPES:
+        x = torch.randn(shape)*0.1
+        slow = timeit(lambda: prox_legacy(x.clone(), args.tau), args.repeat)
+        fast = timeit(lambda: soft_threshold_(x.clone(), args.tau), args.repeat)
+        clone = timeit(lambda: x.clone(), args.repeat) # both timings include one clone of x
+        exact = torch.sign(x)*torch.clamp(x.abs() - args.tau, min=0)
+        diff = (soft_threshold_(x.clone(), args.tau) - exact).abs().max().item()
+        total_legacy += slow - clone
+        total_fused += fast - clone
+        print('{:>16} {:>8} {:>14.2f} {:>14.2f} {:>8.1f}x {:>10.1e}'.format(
+            str(tuple(shape)), x.numel(), 1e6*(slow - clone), 1e6*(fast - clone),
+            (slow - clone)/max(fast - clone, 1e-9), diff))
+    print('whole model: legacy {:.1f} us, fused {:.1f} us per prox step'.format(
+        1e6*total_legacy, 1e6*total_fused))
+
+    # violation of stationarity: every step as before, against the monitor at a cadence of 200 steps
+    params = [torch.nn.Parameter(torch.randn(shape)*0.1) for shape in LENET5_SHAPES]
+    for p in params:
+        p.grad = torch.randn(p.shape)
+    monitor = ViolationMonitor(params, args.tau, every=200)
+    slow = timeit(lambda: violation_legacy(params, args.tau).item(), args.repeat)
+    fused = timeit(monitor.measure, args.repeat)
+    amortized = timeit(monitor.step, args.repeat)
+    print('violation: legacy {:.1f} us, monitor {:.1f} us per measurement, {:.2f} us per step at every=200'.format(
+        1e6*slow, 1e6*fused, 1e6*amortized))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+## Benchmark of the tensorized b-bit quantizer against the original per-element quantmap path
+from __future__ import print_function
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from compression import quantize2
+
+# parameter shapes of Net_FC: fc1.weight, fc1.bias, fc2.weight, fc2.bias
+NET_FC_SHAPES = [(500, 784), (500,), (10, 500), (10,)]
+
+
+## original implementation, kept here as the reference point
+def quantmap(maprange,x): # function to randomly map x to maprange
+    idx = np.searchsorted(maprange, x, side='right')
+    if idx < len(maprange) - 1:
+        prob = float((x - maprange[idx-1])/(maprange[idx] - maprange[idx-1]))
+        y = np.random.choice([maprange[idx-1],maprange[idx]], p=[1-prob,prob])
+        return y
+    else:
+        return x
+
+def quantize2_legacy(atensor,b):
+    shape = list(atensor.size())
+    themin = float(atensor.min())
+    themax = float(atensor.max())
+    maprange = [themin + i*((themax - themin)/((2**b)-1)) for i in range(0,2**b)]
+    alist = atensor.flatten().tolist()
+    alist = [quantmap(maprange,item) for item in alist]
+    alist = np.array(alist, dtype=np.float32)
+    alist = np.reshape(alist, shape)
+    return torch.from_numpy(alist)
+
+
+def timeit(fn, repeat): # best wall time of fn over repeat calls
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='b-bit quantizer benchmark')
+    parser.add_argument('--bits', type=int, default=4, metavar='B',
+                        help='number of bits per entry (default: 4)')
+    parser.add_argument('--repeat', type=int, default=5, metavar='N',
+                        help='timed repetitions of the tensorized quantizer (default: 5)')
+    parser.add_argument('--legacy-max-size', type=int, default=500000, metavar='N',
+                        help='skip the legacy path for layers larger than this (default: 500000)')
+    parser.add_argument('--seed', type=int, default=20200930, metavar='N',
+                        help='random seed (default: 20200930)')
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    np.random.seed(args.seed)
+    gen = torch.Generator().manual_seed(args.seed)
+
+    print('{:>12} {:>10} {:>14} {:>14} {:>10}'.format(
+        'shape', 'numel', 'legacy (ms)', 'tensor (ms)', 'speedup'))
+    for shape in NET_FC_SHAPES:
+        grad = torch.randn(shape)
+        fast = timeit(lambda: quantize2(grad.clone(), args.bits, gen), args.repeat)
+        if grad.numel() <= args.legacy_max_size:
+            slow = timeit(lambda: quantize2_legacy(grad, args.bits), 1)
+            print('{:>12} {:>10} {:>14.3f} {:>14.3f} {:>9.0f}x'.format(
+                str(tuple(shape)), grad.numel(), 1e3*slow, 1e3*fast, slow/fast))
+        else:
+            print('{:>12} {:>10} {:>14} {:>14.3f} {:>10}'.format(
+                str(tuple(shape)), grad.numel(), '-', 1e3*fast, '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+## Benchmark suite: compression and prox kernels, optimizer steps, compressed-SGD rounds and peak memory, as JSON
+# runs offline on synthetic tensors; compare two result files with --compare old.json to spot regressions
+from __future__ import print_function
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from compression import quantize2, quantize_payload, quantize_rows, sparsify, sparsify_payload, sparsify_rows
+from prox import soft_threshold_foreach_
+from optimizers import OPTIMIZERS
+from error_feedback import WorkerGroup, ServerState, bucketed_params, flatten_grads
+from batched_grads import grouped_flat_grads
+from models import Net_FC, num_params
+from bench_quantize import NET_FC_SHAPES, timeit
+from bench_prox import LENET5_SHAPES # LeNet5 and LeNet5_smooth share their parameter shapes
+
+MODELS = {'Net_FC': NET_FC_SHAPES, 'LeNet5': LENET5_SHAPES}
+GROUPS = ('kernels', 'optimizers', 'rounds', 'memory', 'scaling') # scaling is slow, only run when asked for
+UNITS = {'kernels': 'seconds per call', 'optimizers': 'seconds per step', 'rounds': 'rounds per second',
+         'memory': 'MB', 'scaling': 'parameters, seconds per call, seconds per round, MB'}
+
+
+def bench_kernels(args): # seconds per call on all layers of a model
+    gen = torch.Generator().manual_seed(args.seed)
+    results = {}
+    for model, shapes in MODELS.items():
+        grads = [torch.randn(shape, generator=gen) for shape in shapes]
+        kernels = {
+            'quantize2': lambda: [quantize2(g.clone(), args.bits, gen) for g in grads],
+            'quantize_payload': lambda: [quantize_payload(g, args.bits, gen) for g in grads],
+            'sparsify': lambda: [sparsify(g.clone(), args.sfactor) for g in grads],
+            'sparsify_payload': lambda: [sparsify_payload(g, args.sfactor) for g in grads],
+            'prox': lambda: soft_threshold_foreach_([g.clone() for g in grads], 1e-4),
+            'clone': lambda: [g.clone() for g in grads], # baseline included in the in-place kernels
+        }
+        for name, fn in kernels.items():
+            results['kernels/{}/{}'.format(model, name)] = timeit(fn, args.repeat)
+    return results
+
+
+def bench_optimizers(args): # seconds per step on LeNet5_smooth shapes
+    results = {}
+    for name, cls in sorted(OPTIMIZERS.items()):
+        params = [nn.Parameter(torch.randn(shape)) for shape in LENET5_SHAPES]
+        for p in params:
+            p.grad = torch.randn(p.shape)
+        others = [torch.randn(shape) for shape in LENET5_SHAPES]
+        if name == 'Vanilla-SGD':
+            optimizer = cls(params, 1e-4)
+            step = optimizer.step
+        elif name == 'Hybrid-SGD':
+            optimizer = cls(params, 1e-4, 64)
+            step = lambda: optimizer.step(other_grads=others)
+        else:
+            optimizer = cls(params, 1e-4, 64)
+            step = optimizer.step
+        step() # the first step allocates the state
+        results['optimizers/' + name] = timeit(lambda: [step() for _ in range(10)], args.repeat)/10
+    return results
+
+
+class Round(object): # one communication round of the 10-worker error-compensated loop on synthetic data
+    def __init__(self, compressor, batched, b_sz=10, num_workers=10, bits=4, sfactor=0.1, seed=20200930,
+                 model_size=None, bucket_bytes=None):
+        torch.manual_seed(seed)
+        self.model = Net_FC(**(model_size or {}))
+        self.batched = batched
+        self.num_workers = num_workers
+        self.data = torch.randn(num_workers, b_sz, 1, 28, 28)
+        self.target = torch.randint(0, 10, (num_workers, b_sz))
+        shapes = [p.shape for p in self.model.parameters()]
+        self.workers = WorkerGroup(num_workers, shapes, bucket_bytes=bucket_bytes)
+        self.server = ServerState(shapes, num_workers, bucket_bytes=bucket_bytes)
+        self.params = bucketed_params(self.model.parameters(), bucket_bytes)
+        self.gradbuf = torch.zeros(sum(p.numel() for p in self.model.parameters()))
+        self.gradblock = torch.zeros(num_workers, self.gradbuf.numel())
+        if compressor == 'top-s':
+            self.compress = lambda v: sparsify_payload(v, sfactor)
+            self.compress_rows = lambda V: sparsify_rows(V, sfactor)
+        else:
+            self.compress = lambda v: quantize_payload(v, bits)
+            self.compress_rows = lambda V: quantize_rows(V, bits)
+
+    def __call__(self):
+        server = self.server
+        server.start_round()
+        if self.batched:
+            grouped_flat_grads(self.model, self.data, self.target, out=self.gradblock)
+            self.workers.compress(self.gradblock, self.compress_rows, server)
+        else:
+            for i in range(self.num_workers):
+                self.model.zero_grad()
+                F.nll_loss(self.model(self.data[i]), self.target[i]).backward()
+                flatten_grads(self.model.parameters(), self.gradbuf)
+                server.receive(self.workers[i].compress(self.gradbuf, self.compress))
+        server.update(self.params, self.compress, 1e-3)
+
+
+def bench_rounds(args): # rounds per second
+    results = {}
+    for compressor in ('top-s', 'b-bit'):
+        for batched in (False, True):
+            one_round = Round(compressor, batched, bits=args.bits, sfactor=args.sfactor, seed=args.seed)
+            one_round() # warm-up
+            elapsed = timeit(lambda: [one_round() for _ in range(args.rounds)], 1)
+            results['rounds/{}/{}'.format(compressor, 'batched' if batched else 'sequential')] = args.rounds/elapsed
+        # the whole model as one bucket: one compressor call per worker instead of one per layer
+        one_round = Round(compressor, False, bits=args.bits, sfactor=args.sfactor, seed=args.seed,
+                          bucket_bytes=math.inf)
+        one_round()
+        elapsed = timeit(lambda: [one_round() for _ in range(args.rounds)], 1)
+        results['rounds/{}/one-bucket'.format(compressor)] = args.rounds/elapsed
+    return results
+
+
+def _peak_rss(args): # child process: peak RSS in MB after epochs of rounds and optimizer steps
+    torch.set_num_threads(args.threads)
+    one_round = Round('top-s', False, bits=args.bits, sfactor=args.sfactor, seed=args.seed)
+    params = [nn.Parameter(torch.randn(shape)) for shape in LENET5_SHAPES]
+    for p in params:
+        p.grad = torch.randn(p.shape)
+    optimizer = OPTIMIZERS['Hybrid-SGD'](params, 1e-4, 64)
+    others = [torch.randn(shape) for shape in LENET5_SHAPES]
+    peaks = [resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.] # kB on Linux; imports and setup only
+    for epoch in range(args.epochs):
+        for _ in range(args.rounds):
+            one_round()
+            optimizer.step(other_grads=others)
+        peaks.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.)
+    return peaks
+
+def bench_memory(args): # peak RSS of a fresh process before training, after the first and after the last epoch
+    with multiprocessing.get_context('spawn').Pool(1) as pool: # not forked: nothing inherited from the other groups
+        peaks = pool.apply(_peak_rss, (args,))
+    return {'memory/peak_rss_setup_mb': peaks[0], 'memory/peak_rss_first_epoch_mb': peaks[1],
+            'memory/peak_rss_mb': peaks[-1], 'memory/growth_mb': peaks[-1] - peaks[1]}
+
+
+def _scale(args, width): # child process: cost of one model size
+    torch.set_num_threads(args.threads)
+    one_round = Round('top-s', False, bits=args.bits, sfactor=args.sfactor, seed=args.seed,
+                      model_size={'width': width, 'depth': args.scale_depth})
+    grads = [p.detach().clone() for p in one_round.model.parameters()]
+    name = 'scaling/width={},depth={}/'.format(width, args.scale_depth)
+    results = {name + 'params': num_params(one_round.model),
+               name + 'sparsify_payload': timeit(lambda: [sparsify_payload(g, args.sfactor) for g in grads], 3),
+               name + 'quantize_payload': timeit(lambda: [quantize_payload(g, args.bits) for g in grads], 3)}
+    one_round() # warm-up
+    results[name + 'round'] = timeit(one_round, 3)
+    results[name + 'peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    return results
+
+def bench_scaling(args): # Net_FC of growing width: compression and round time, peak memory of a fresh process each
+    results = {}
+    for width in args.scale_widths:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            results.update(pool.apply(_scale, (args, width)))
+    return results
+
+
+def environment(): # what the numbers depend on, stored next to them
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'torch': torch.__version__, 'machine': platform.machine(), 'threads': torch.get_num_threads()}
+
+
+def higher_is_better(name):
+    return name.startswith('rounds/')
+
+def informative(name): # entries that are not costs
+    return name.startswith('memory/growth') or name.endswith('/params')
+
+def compare(old, new, tolerance): # print the change of every shared entry, returns the regressed ones
+    regressed = []
+    print('{:<48} {:>12} {:>12} {:>8}'.format('benchmark', 'old', 'new', 'change'))
+    for name in sorted(set(old) & set(new)):
+        ratio = new[name]/old[name] if old[name] else float('inf')
+        worse = ratio < 1 - tolerance if higher_is_better(name) else ratio > 1 + tolerance
+        if worse and not informative(name):
+            regressed.append(name)
+        print('{:<48} {:>12.4g} {:>12.4g} {:>7.1f}% {}'.format(name, old[name], new[name], 100.*(ratio - 1),
+                                                             'REGRESSED' if name in regressed else ''))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark suite')
+    parser.add_argument('--groups', nargs='+', default=list(GROUPS[:-1]), choices=GROUPS,
+                        help='groups to run (default: all but scaling)')
+    parser.add_argument('--out', default=None, metavar='FILE',
+                        help='JSON file for the results (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', default=None, metavar='FILE',
+                        help='earlier JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, metavar='F',
+                        help='relative slowdown reported as a regression (default: 0.1)')
+    parser.add_argument('--repeat', type=int, default=20, metavar='N',
+                        help='timed repetitions of kernels and optimizer steps, best one kept (default: 20)')
+    parser.add_argument('--rounds', type=int, default=20, metavar='N',
+                        help='communication rounds per timing and per memory epoch (default: 20)')
+    parser.add_argument('--epochs', type=int, default=10, metavar='N',
+                        help='epochs of the memory group (default: 10)')
+    parser.add_argument('--bits', type=int, default=4, metavar='B',
+                        help='bits per entry of the quantizer (default: 4)')
+    parser.add_argument('--sfactor', type=float, default=0.1, metavar='S',
+                        help='fraction of entries kept by top-s (default: 0.1)')
+    parser.add_argument('--scale-widths', type=int, nargs='+', default=[500, 2000, 5000], metavar='W',
+                        help='hidden units of the Net_FC sizes in the scaling group (default: 500 2000 5000)')
+    parser.add_argument('--scale-depth', type=int, default=4, metavar='N',
+                        help='hidden layers of the Net_FC sizes in the scaling group (default: 4)')
+    parser.add_argument('--threads', type=int, default=1, metavar='N',
+                        help='torch threads (default: 1, as in the sweeps)')
+    parser.add_argument('--seed', type=int, default=20200930, metavar='N',
+                        help='random seed (default: 20200930)')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    results = {}
+    for group in args.groups:
+        start = time.perf_counter()
+        results.update(globals()['bench_' + group](args))
+        print('{}: {:.1f}s'.format(group, time.perf_counter() - start))
+
+    env = environment()
+    out = args.out
+    if out is None:
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                           '{}.json'.format((env['commit'] or 'unknown')[:12]))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({'environment': env, 'settings': vars(args), 'units': UNITS, 'results': results}, f, indent=1, sort_keys=True)
+    print('results written to {}'.format(out))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)['results']
+        regressed = compare(old, results, args.tolerance)
+        if regressed:
+            sys.exit('{} benchmarks regressed by more than {:.0f}%'.format(len(regressed), 100*args.tolerance))
+    else:
+        for name, value in sorted(results.items()):
+            print('{:<48} {:>12.4g}'.format(name, value))
+
+
+if __name__ == '__main__':
+    main()
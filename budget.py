@@ -0,0 +1,149 @@
+## Per-bucket compression chosen every round to fit a budget of bytes per round
+# instead of one fixed sfactor or b for every layer, BudgetController splits the bytes of a round between the
+# buckets of error_feedback.bucket_ranges by running averages of their compression errors: local (errloc) and
+# central (errcen). Buckets whose error is largest get more entries or more bits. What was actually sent is fed
+# back, so the average bytes per round converge to the budget even where the byte model is off (ties, zeros)
+import heapq
+import torch
+from compression import QuantizedPayload, quantize_payload, quantize_rows, sparsify_payload, sparsify_rows
+
+SCHEMES = ('top-s', 'b-bit')
+
+
+def waterfill(total, weights, caps): # split total in proportion to weights, no share above its cap
+    shares = [0.]*len(weights)
+    free = [i for i in range(len(weights)) if caps[i] > 0]
+    while free:
+        wsum = sum(weights[i] for i in free)
+        for i in free:
+            shares[i] = total*weights[i]/wsum if wsum > 0 else total/len(free)
+        full = [i for i in free if shares[i] >= caps[i]]
+        if not full:
+            break
+        for i in full: # capped, what is left goes to the others
+            shares[i] = caps[i]
+            total -= caps[i]
+        free = [i for i in free if i not in full]
+    return shares
+
+
+class BudgetController(object): # sfactor or bits of every bucket for the next round
+    def __init__(self, ranges, budget, num_workers, scheme='top-s', value_dtype=torch.float32, decay=0.9,
+                 min_bits=1, max_bits=8):
+        # ranges are the (offset, size) buckets of the flat buffers, budget the bytes of a round: the uplink of
+        # every local server plus the broadcast to all of them, as counted in ServerState.nbytes
+        if scheme not in SCHEMES:
+            raise ValueError('scheme must be one of {}'.format(SCHEMES))
+        self.ranges = list(ranges)
+        self.sizes = [n for _, n in self.ranges]
+        self.budget = budget
+        self.messages = 2*num_workers # every bucket goes up once per local server and is broadcast to each
+        self.scheme = scheme
+        self.value_dtype = value_dtype
+        self.decay = decay # of the running averages of the squared error norms
+        self.min_bits, self.max_bits = min_bits, max_bits
+        if budget < self.minimum():
+            raise ValueError('a budget of {} bytes per round is below the smallest round, {} bytes'.format(
+                budget, self.minimum()))
+        self.errors = None # running average of the squared error norm of each bucket, normalized for b-bit
+        self.sent = 0 # bytes sent and rounds observed so far
+        self.rounds = 0
+        self.sfactors = [1.]*len(self.sizes)
+        self.bits = [max_bits]*len(self.sizes)
+        self.plan()
+        # one compressor per bucket, reading the current settings
+        if scheme == 'top-s':
+            self.compress = [self._sparsify(i) for i in range(len(self.sizes))]
+            self.compress_rows = [self._sparsify_rows(i) for i in range(len(self.sizes))]
+        else:
+            self.compress = [self._quantize(i) for i in range(len(self.sizes))]
+            self.compress_rows = [self._quantize_rows(i) for i in range(len(self.sizes))]
+
+    def _sparsify(self, i):
+        return lambda v: sparsify_payload(v, self.sfactors[i], self.value_dtype)
+
+    def _sparsify_rows(self, i):
+        return lambda V: sparsify_rows(V, self.sfactors[i], self.value_dtype)
+
+    def _quantize(self, i):
+        return lambda v: quantize_payload(v, self.bits[i])
+
+    def _quantize_rows(self, i):
+        return lambda V: quantize_rows(V, self.bits[i])
+
+    def entry_bytes(self): # int32 index and value of a kept top-s entry
+        return 4 + torch.finfo(self.value_dtype).bits//8
+
+    def minimum(self): # bytes of the smallest round: one entry or min_bits per entry in every bucket
+        if self.scheme == 'top-s':
+            return self.messages*len(self.sizes)*self.entry_bytes()
+        return self.messages*sum(self.nbytes(n, self.min_bits) for n in self.sizes)
+
+    def target(self): # bytes for the next round, making up for what earlier rounds sent above or below budget
+        return min(max(self.budget*(self.rounds + 1) - self.sent, 0.5*self.budget), 1.5*self.budget)
+
+    def plan(self): # settings of every bucket for the next round
+        per_message = self.target()/self.messages
+        if self.scheme == 'top-s':
+            # kept entries in proportion to the error norms, a bucket keeps at most all of its entries
+            entry_bytes = self.entry_bytes()
+            weights = self.sizes if self.errors is None else [e**0.5 for e in self.errors]
+            shares = waterfill(per_message/entry_bytes, weights, self.sizes)
+            # half an entry of slack so that int(sfactor*n) in the compressor lands on the share
+            self.sfactors = [min(max(int(s), 1) + 0.5, n)/n for s, n in zip(shares, self.sizes)]
+        else:
+            # greedy: one more bit where it removes the most error per byte; a bit cuts the quantization error
+            # of a bucket by 4 and costs n/8 bytes; errors are normalized to 0 bits, uniform ones to start
+            errors = self.sizes if self.errors is None else self.errors
+            bits = [self.min_bits]*len(self.sizes)
+            spent = sum(self.nbytes(n, b) for n, b in zip(self.sizes, bits))
+            heap = [(-0.75*e*4.**-b/n, i) for i, (e, n, b) in enumerate(zip(errors, self.sizes, bits))]
+            heapq.heapify(heap)
+            while heap:
+                _, i = heapq.heappop(heap)
+                cost = self.nbytes(self.sizes[i], bits[i] + 1) - self.nbytes(self.sizes[i], bits[i])
+                if spent + cost > per_message:
+                    continue # too large for what is left, smaller buckets may still fit
+                bits[i] += 1
+                spent += cost
+                if bits[i] < self.max_bits:
+                    heapq.heappush(heap, (-0.75*errors[i]*4.**-bits[i]/self.sizes[i], i))
+            self.bits = bits
+
+    @staticmethod
+    def nbytes(n, b): # bytes of a b-bit message of n entries, as QuantizedPayload.nbytes
+        return -(-n*b//8) + QuantizedPayload.header_bytes
+
+    def observe(self, errloc, errcen, nbytes): # after the round: [num_workers, n] local and flat central errors
+        # and the bytes sent; updates the running averages and plans the next round
+        squares = []
+        for i, (offset, n) in enumerate(self.ranges):
+            e = float(errloc[:, offset:offset+n].pow(2).sum())/errloc.shape[0] + \
+                float(errcen[offset:offset+n].pow(2).sum())
+            if self.scheme == 'b-bit':
+                e *= 4.**self.bits[i] # what the error would be at 0 bits
+            squares.append(e)
+        if self.errors is None:
+            self.errors = squares
+        else:
+            self.errors = [self.decay*a + (1 - self.decay)*e for a, e in zip(self.errors, squares)]
+        self.sent += nbytes
+        self.rounds += 1
+        self.plan()
+
+    def summary(self): # one line of the current settings
+        if self.scheme == 'top-s':
+            settings = ' '.join('{:.3g}'.format(s) for s in self.sfactors)
+            return 'sfactor per bucket: {} ({:.0f} bytes per round on average)'.format(
+                settings, self.sent/max(self.rounds, 1))
+        return 'bits per bucket: {} ({:.0f} bytes per round on average)'.format(
+            ' '.join(str(b) for b in self.bits), self.sent/max(self.rounds, 1))
+
+    def state_dict(self):
+        return {'errors': self.errors, 'sent': self.sent, 'rounds': self.rounds}
+
+    def load_state_dict(self, state):
+        self.errors = state['errors']
+        self.sent = state['sent']
+        self.rounds = state['rounds']
+        self.plan()
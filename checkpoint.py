@@ -0,0 +1,70 @@
+## Periodic, atomic checkpoints of a training run, written on a background thread
+# a checkpoint is a dict of tensors, numbers, lists and RNG states; save() copies the tensors and returns,
+# the copy is written to <path>.tmp and renamed over <path> by the writer thread, so a crash at any time
+# leaves either the previous or the new checkpoint on disk
+import os
+import random as pyrandom
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+import torch
+
+
+def rng_state(): # states of the torch, numpy and python global generators
+    return {'torch': torch.get_rng_state(), 'numpy': np.random.get_state(), 'python': pyrandom.getstate()}
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    pyrandom.setstate(state['python'])
+
+
+def snapshot(obj): # copy of the tensors in a nested dict/list/tuple, taken before training changes them
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().clone()
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+def resolve(obj): # obj with every Future replaced by its result, e.g. a pending background test
+    if isinstance(obj, Future):
+        return obj.result()
+    if isinstance(obj, dict):
+        return {key: resolve(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(resolve(value) for value in obj)
+    return obj
+
+
+class Checkpointer(object): # one checkpoint file per run, rewritten every every-th epoch
+    def __init__(self, path, every=1):
+        self.path = path
+        self.every = every
+        self.pool = ThreadPoolExecutor(1)
+        self.pending = None
+
+    def due(self, epoch): # save after this epoch (counted from 0)?
+        return (epoch + 1) % self.every == 0
+
+    def save(self, state): # copies the tensors of state now, writes them in the background
+        if self.pending is not None: # at most one write in flight
+            self.pending.result()
+        self.pending = self.pool.submit(self._write, snapshot(state))
+
+    def _write(self, state):
+        tmpname = self.path + '.tmp'
+        torch.save(resolve(state), tmpname)
+        os.replace(tmpname, self.path)
+
+    def load(self): # last complete checkpoint, None if there is none
+        if not os.path.exists(self.path):
+            return None
+        return torch.load(self.path, weights_only=False)
+
+    def close(self, remove=False): # wait for the last write; remove the file once the run is complete
+        if self.pending is not None:
+            self.pending.result()
+        self.pool.shutdown(wait=True)
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
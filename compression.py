@@ -0,0 +1,172 @@
+## Gradient compression operators shared by the error-compensated SGD scripts
+import torch
+
+
+## functions for b-bit quantization
+def quantize2(atensor, b, generator=None): # b-bit quantization operator for vector and tensor
+    # atensor is overwritten in place with its stochastic rounding onto 2**b evenly
+    # spaced levels between its min and max; pass a torch.Generator to make it reproducible
+    levels = (2**b) - 1
+    themin = float(atensor.min())
+    themax = float(atensor.max())
+    scale = (themax - themin)/levels
+    if scale == 0: # constant tensor already sits on the grid
+        return atensor
+
+    # express atensor in units of the grid, so level i sits at i
+    atensor.sub_(themin).div_(scale)
+    # floor(x + u) with u ~ U[0,1) rounds x up with probability equal to its fractional part,
+    # so the expected value of the quantized tensor is atensor itself
+    atensor.add_(torch.rand(atensor.shape, generator=generator,
+                            dtype=atensor.dtype, device=atensor.device))
+    atensor.floor_().clamp_(0, levels)
+    atensor.mul_(scale).add_(themin) # map levels back onto [themin, themax]
+    return atensor
+
+
+def quantize_rows(V, b, generator=None): # quantize2 applied to every row of the 2-D tensor V at once
+    # returns the dequantized rows and the bytes their packed codes and headers take on the wire
+    levels = (2**b) - 1
+    themin = V.amin(1, keepdim=True)
+    scale = (V.amax(1, keepdim=True) - themin)/levels
+    scale = torch.where(scale == 0, torch.ones_like(scale), scale) # constant rows map to level 0
+    x = (V - themin).div_(scale)
+    x.add_(torch.rand(x.shape, generator=generator, dtype=x.dtype, device=x.device))
+    x.floor_().clamp_(0, levels)
+    x.mul_(scale).add_(themin)
+    nbytes = V.shape[0]*(-(-V.shape[1]*b//8) + QuantizedPayload.header_bytes)
+    return x, nbytes
+
+
+def pack_bits(codes, b): # pack b-bit codes (uint8 entries below 2**b) into a flat uint8 buffer
+    codes = codes.view(-1)
+    if 8 % b == 0: # whole codes per byte, e.g. two 4-bit codes
+        per = 8//b
+        pad = (-codes.numel()) % per
+        if pad:
+            codes = torch.cat([codes, codes.new_zeros(pad)])
+        shifts = torch.arange(0, 8, b, dtype=torch.uint8, device=codes.device)
+        return (codes.view(-1, per) << shifts).sum(1).to(torch.uint8)
+
+    # general b: lay out the bits of every code in order, then pack 8 bits per byte
+    bits = (codes.unsqueeze(1) >> torch.arange(b, dtype=torch.uint8, device=codes.device)) & 1
+    bits = bits.view(-1)
+    pad = (-bits.numel()) % 8
+    if pad:
+        bits = torch.cat([bits, bits.new_zeros(pad)])
+    shifts = torch.arange(8, dtype=torch.uint8, device=codes.device)
+    return (bits.view(-1, 8) << shifts).sum(1).to(torch.uint8)
+
+def unpack_bits(buf, b, numel): # inverse of pack_bits, returns numel uint8 codes
+    if 8 % b == 0:
+        shifts = torch.arange(0, 8, b, dtype=torch.uint8, device=buf.device)
+        return ((buf.unsqueeze(1) >> shifts) & ((2**b) - 1)).view(-1)[:numel]
+
+    shifts = torch.arange(8, dtype=torch.uint8, device=buf.device)
+    bits = ((buf.unsqueeze(1) >> shifts) & 1).view(-1)[:numel*b]
+    shifts = torch.arange(b, dtype=torch.uint8, device=buf.device)
+    return (bits.view(numel, b) << shifts).sum(1).to(torch.uint8)
+
+
+class QuantizedPayload(object): # b-bit message on the wire: packed level codes plus a (min, scale) header
+    header_bytes = 8 # themin and scale as two float32
+
+    def __init__(self, packed, themin, scale, b, shape):
+        self.packed = packed
+        self.themin = themin
+        self.scale = scale
+        self.b = b
+        self.shape = shape
+
+    @property
+    def nbytes(self): # bytes sent for this message
+        return self.packed.numel() + self.header_bytes
+
+    def add_to(self, atensor, alpha=1): # dequantize and add alpha*(decoded message) into atensor, in place
+        levels = unpack_bits(self.packed, self.b, atensor.numel()).to(atensor.dtype)
+        levels.mul_(self.scale).add_(self.themin)
+        atensor.view(-1).add_(levels, alpha=alpha)
+        return atensor
+
+def quantize_payload(atensor, b, generator=None): # same rounding as quantize2, atensor is left untouched
+    levels = (2**b) - 1
+    themin = float(atensor.min())
+    themax = float(atensor.max())
+    scale = (themax - themin)/levels
+    if scale == 0: # constant tensor, every code is level 0
+        codes = torch.zeros(atensor.numel(), dtype=torch.uint8, device=atensor.device)
+    else:
+        x = (atensor.view(-1) - themin).div_(scale)
+        x.add_(torch.rand(x.shape, generator=generator, dtype=x.dtype, device=x.device))
+        codes = x.floor_().clamp_(0, levels).to(torch.uint8)
+    return QuantizedPayload(pack_bits(codes, b), themin, scale, b, atensor.shape)
+
+
+## functions for top-s sparsification
+def topk_threshold(absflat, s, sample_size=None, generator=None): # magnitude of the s-th largest entry of absflat
+    n = absflat.numel()
+    if sample_size is not None and n > sample_size:
+        # estimate the threshold from the same quantile of a random sample of magnitudes
+        idx = torch.randint(n, (sample_size,), generator=generator, device=absflat.device)
+        absflat = absflat[idx]
+        s = max(1, round(s*sample_size/n))
+    # partial selection of the s largest magnitudes, O(n) instead of a full sort
+    return torch.topk(absflat, s, sorted=False).values.min()
+
+def sparsify(atensor, sfactor, sample_size=None, generator=None): # top-s sparsification operator for vector and tensor
+    # atensor is overwritten in place: entries of magnitude below the s-th largest are zeroed,
+    # ties with the s-th largest are kept
+    n = atensor.numel()
+    s = int(sfactor*n) # compute s to nearest smaller integer
+    if s < 1: # s is too small to sparsify, keep every entry
+        s = n
+
+    absflat = atensor.abs().view(-1)
+    threshold = topk_threshold(absflat, s, sample_size, generator)
+    atensor.view(-1).masked_fill_(absflat < threshold, 0)
+    return atensor
+
+
+class SparsePayload(object): # top-s message on the wire: int32 flat indices and their values
+    def __init__(self, indices, values, shape):
+        self.indices = indices
+        self.values = values
+        self.shape = shape
+
+    @property
+    def nbytes(self): # bytes sent for this message
+        return self.indices.numel()*self.indices.element_size() + \
+            self.values.numel()*self.values.element_size()
+
+    def add_to(self, atensor, alpha=1): # scatter-add alpha*(decoded message) into atensor, in place
+        atensor.view(-1).index_add_(0, self.indices.long(), self.values.to(atensor.dtype), alpha=alpha)
+        return atensor
+
+def sparsify_payload(atensor, sfactor, value_dtype=torch.float32, sample_size=None, generator=None):
+    # same selection as sparsify, but atensor is left untouched and only the kept entries are returned
+    n = atensor.numel()
+    s = int(sfactor*n)
+    if s < 1:
+        s = n
+
+    flat = atensor.view(-1)
+    absflat = flat.abs()
+    threshold = topk_threshold(absflat, s, sample_size, generator)
+    # zero entries are never sent, they matter once more than n - s entries are zero and the threshold is 0
+    indices = ((absflat >= threshold) & (absflat > 0)).nonzero().view(-1)
+    return SparsePayload(indices.int(), flat[indices].to(value_dtype), atensor.shape)
+
+
+def sparsify_rows(V, sfactor, value_dtype=torch.float32): # sparsify_payload applied to every row of the 2-D tensor V
+    # returns the dense compressed rows and the bytes their (index, value) pairs take on the wire
+    n = V.shape[1]
+    s = int(sfactor*n)
+    if s < 1:
+        s = n
+
+    absV = V.abs()
+    threshold = torch.topk(absV, s, dim=1, sorted=False).values.amin(1, keepdim=True)
+    mask = (absV >= threshold) & (absV > 0)
+    C = torch.where(mask, V.to(value_dtype).to(V.dtype), torch.zeros_like(V))
+    nbytes = int(mask.sum())*(4 + torch.finfo(value_dtype).bits//8)
+    return C, nbytes
@@ -0,0 +1,197 @@
+## Error-feedback state and communication round shared by the error-compensated compressed SGD scripts
+from concurrent.futures import ThreadPoolExecutor
+import math
+import torch
+from instrument import DISABLED
+
+
+def flat_views(flat, shapes): # views into a flat buffer, laid out layer by layer
+    views = []
+    offset = 0
+    for shape in shapes:
+        n = torch.Size(shape).numel()
+        views.append(flat[offset:offset+n].view(shape))
+        offset += n
+    return views
+
+def bucket_ranges(shapes, bucket_bytes=None, element_size=4): # (offset, size) of each bucket of the flat buffer
+    # None: one bucket per layer; otherwise consecutive layers are packed into buckets of at most bucket_bytes,
+    # a larger layer gets a bucket of its own, and math.inf puts the whole model in one bucket (global top-s)
+    sizes = [torch.Size(shape).numel() for shape in shapes]
+    ranges = []
+    offset = 0
+    for n in sizes:
+        if bucket_bytes is not None and ranges and (ranges[-1][1] + n)*element_size <= bucket_bytes:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + n)
+        else:
+            ranges.append((offset, n))
+        offset += n
+    return ranges
+
+def bucket_views(flat, shapes, bucket_bytes=None): # views into a flat buffer, one per bucket
+    if bucket_bytes is None: # layer by layer, shaped like the layers
+        return flat_views(flat, shapes)
+    return [flat[offset:offset+n] for offset, n in bucket_ranges(shapes, bucket_bytes, flat.element_size())]
+
+def per_bucket(compress, count): # compress is one compressor for every bucket or a list of one per bucket
+    return list(compress) if isinstance(compress, (list, tuple)) else [compress]*count
+
+def flatten_grads(params, out): # copy the gradients of all layers into the flat buffer out, one op
+    return torch.cat([p.grad.view(-1) for p in params], out=out)
+
+def flatten_params_(params): # move the parameters into one flat buffer and return it, each parameter becomes a view
+    # lets bucketed updates be applied to the bucket views of the parameters
+    params = list(params)
+    flat = torch.cat([p.detach().view(-1) for p in params])
+    offset = 0
+    for p in params:
+        p.data = flat[offset:offset+p.numel()].view_as(p)
+        offset += p.numel()
+    return flat
+
+def bucketed_params(params, bucket_bytes=None): # what ServerState.update applies the buckets to
+    params = list(params)
+    if bucket_bytes is None:
+        return params
+    return bucket_views(flatten_params_(params), [p.shape for p in params], bucket_bytes)
+
+
+def add_arguments(parser): # command-line knobs of the buckets
+    parser.add_argument('--bucket-mb', type=float, default=None, metavar='MB',
+                        help='compress consecutive layers together in buckets of up to MB megabytes (default: per layer)')
+    parser.add_argument('--one-bucket', action='store_true', default=False,
+                        help='compress the whole model as one bucket, e.g. global top-s')
+    return parser
+
+def bucket_size(args): # bucket_bytes from add_arguments options
+    if args.one_bucket:
+        return math.inf
+    return None if args.bucket_mb is None else int(args.bucket_mb*2**20)
+
+
+class WorkerState(object): # compression error of one local server, all layers in one flat fp32 buffer
+    def __init__(self, err, shapes, bucket_bytes=None):
+        self.err = err
+        self.layers = bucket_views(err, shapes, bucket_bytes) # compressed one by one: layers or buckets
+
+    def compress(self, grad, compress): # error-compensated compression of the flat gradient grad
+        # compress is one compressor for every bucket or a list of one per bucket
+        # err becomes v = grad + err in one fused op, then err = v - C(v) bucket by bucket
+        self.err.add_(grad)
+        payloads = [c(v) for c, v in zip(per_bucket(compress, len(self.layers)), self.layers)]
+        for payload, v in zip(payloads, self.layers):
+            payload.add_to(v, alpha=-1)
+        return payloads
+
+
+class GradientPipeline(object): # compress each bucket on a worker thread as soon as backward has produced its gradients
+    # post-accumulate-grad hooks hand every layer to the thread while autograd is still computing the earlier
+    # layers; the thread adds it to the error buffer and compresses a bucket once all of its layers are in.
+    # Between start(worker) and finish() the hooks compress into worker, otherwise they do nothing
+    def __init__(self, params, compress, bucket_bytes=None):
+        self.params = list(params)
+        shapes = [p.shape for p in self.params]
+        self.offsets = [offset for offset, _ in bucket_ranges(shapes)] # of each layer in the flat buffer
+        buckets = bucket_ranges(shapes, bucket_bytes)
+        self.compress = per_bucket(compress, len(buckets))
+        self.bucket_of = [sum(1 for start, _ in buckets if start <= offset) - 1 for offset in self.offsets]
+        self.sizes = [self.bucket_of.count(b) for b in range(len(buckets))] # layers per bucket
+        self.pool = ThreadPoolExecutor(1) # one thread: layers of a worker never race on its error buffer
+        self.worker = None
+        self.futures = []
+        self.handles = [p.register_post_accumulate_grad_hook(self._hook(i)) for i, p in enumerate(self.params)]
+
+    def _hook(self, i):
+        def hook(p):
+            if self.worker is not None:
+                self.futures.append(self.pool.submit(self._add, i, p.grad))
+        return hook
+
+    def _add(self, i, grad): # on the thread: error compensation of layer i, compression once its bucket is full
+        self.worker.err[self.offsets[i]:self.offsets[i] + grad.numel()].add_(grad.view(-1))
+        b = self.bucket_of[i]
+        self.missing[b] -= 1
+        if self.missing[b] == 0:
+            v = self.worker.layers[b]
+            self.payloads[b] = self.compress[b](v)
+            self.payloads[b].add_to(v, alpha=-1)
+
+    def start(self, worker): # the next backward pass is compressed into worker, a WorkerState with the same buckets
+        self.worker = worker
+        self.missing = list(self.sizes)
+        self.payloads = [None]*len(self.sizes)
+
+    def finish(self): # payloads of every bucket in order, waits for the ones still in flight
+        for future in self.futures:
+            future.result()
+        self.worker = None
+        self.futures = []
+        return self.payloads
+
+    def close(self):
+        for handle in self.handles:
+            handle.remove()
+        self.pool.shutdown(wait=True)
+
+
+class WorkerGroup(object): # all local servers: one [num_workers, n] error block, one contiguous row per worker
+    def __init__(self, num_workers, shapes, dtype=torch.float32, bucket_bytes=None):
+        numel = sum(torch.Size(shape).numel() for shape in shapes)
+        self.block = torch.zeros(num_workers, numel, dtype=dtype)
+        self.workers = [WorkerState(self.block[i], shapes, bucket_bytes) for i in range(num_workers)]
+        # (offset, size) of each bucket within a row
+        self.columns = bucket_ranges(shapes, bucket_bytes, self.block.element_size())
+
+    def __getitem__(self, i):
+        return self.workers[i]
+
+    def __len__(self):
+        return len(self.workers)
+
+    def compress(self, grads, compress_rows, server): # every worker at once, grads is [num_workers, n]
+        # compress_rows maps a [num_workers, size] slice to its compressed rows and the bytes they take,
+        # or is a list of one such function per bucket
+        self.block.add_(grads)
+        for (offset, n), acc, compress in zip(self.columns, server.acc_layers,
+                                              per_bucket(compress_rows, len(self.columns))):
+            V = self.block[:, offset:offset+n]
+            C, nbytes = compress(V)
+            acc.view(-1).add_(C.sum(0))
+            V.sub_(C) # compression error of every worker
+            server.nbytes += nbytes
+
+
+class ServerState(object): # central server: aggregation buffer zeroed every round and its own compression error
+    def __init__(self, shapes, num_workers, dtype=torch.float32, bucket_bytes=None):
+        numel = sum(torch.Size(shape).numel() for shape in shapes)
+        self.num_workers = num_workers
+        self.acc = torch.zeros(numel, dtype=dtype)
+        self.err = torch.zeros(numel, dtype=dtype)
+        self.acc_layers = bucket_views(self.acc, shapes, bucket_bytes)
+        self.layers = bucket_views(self.err, shapes, bucket_bytes)
+        self.nbytes = 0 # bytes sent by local and central servers during this round
+
+    def start_round(self):
+        self.acc.zero_()
+        self.nbytes = 0
+
+    def receive(self, payloads): # messages are decoded only here, a sparse add costs O(s) not O(n)
+        for payload, acc in zip(payloads, self.acc_layers):
+            payload.add_to(acc)
+            self.nbytes += payload.nbytes
+
+    def update(self, params, compress, step, timer=DISABLED): # average, compress with error feedback, broadcast and update
+        # params are laid out like the buckets: the parameters, or bucket_views of flatten_params_ when bucketed;
+        # compress as in WorkerState.compress; returns the payloads broadcast to the local servers
+        with timer.phase('aggregation'):
+            self.err.add_(self.acc, alpha=1./self.num_workers)
+        payloads = []
+        for p, v, c in zip(params, self.layers, per_bucket(compress, len(self.layers))):
+            with timer.phase('server compression'):
+                payload = c(v)
+                payload.add_to(v, alpha=-1) # central compression error
+            with timer.phase('update'):
+                payload.add_to(p.data, alpha=-step) # update global model
+            self.nbytes += self.num_workers*payload.nbytes # broadcast to every local server
+            payloads.append(payload)
+        return payloads
@@ -0,0 +1,100 @@
+## Pre-normalized FashionMNIST arrays on disk, memory-mapped by the training scripts
+# the raw IDX files (plain or .gz, as torchvision downloads them to <root>/FashionMNIST/raw) are converted
+# once to float32 .npy arrays normalized with the usual FashionMNIST mean and std; every later run opens
+# them copy-on-write with mmap, so sweep processes share the page cache and start without any decoding
+import gzip
+import os
+import numpy as np
+import torch
+
+MEAN = 0.1307
+STD = 0.3081
+RAW_FILES = {True: ('train-images-idx3-ubyte', 'train-labels-idx1-ubyte'),
+             False: ('t10k-images-idx3-ubyte', 't10k-labels-idx1-ubyte')}
+
+
+def read_idx(path): # numpy array stored in an IDX file, plain or gzipped
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        buf = f.read()
+    ndim = buf[3]
+    shape = np.frombuffer(buf, dtype='>i4', count=ndim, offset=4)
+    return np.frombuffer(buf, dtype=np.uint8, offset=4 + 4*ndim).reshape(shape)
+
+def raw_path(root, name): # local IDX file of the given name, plain preferred over gzipped
+    for path in (os.path.join(root, 'FashionMNIST', 'raw', name),
+                 os.path.join(root, 'FashionMNIST', 'raw', name + '.gz')):
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError('{} not found under {}; run build(download=True) once'.format(
+        name, os.path.join(root, 'FashionMNIST', 'raw')))
+
+def cache_dir(root='data'): # directory of the cached arrays and of other derived data, e.g. partitions
+    return os.path.join(root, 'FashionMNIST', 'cache')
+
+def cache_paths(root, train): # .npy files of the images and the labels
+    split = 'train' if train else 'test'
+    return os.path.join(cache_dir(root), split + '_images.npy'), os.path.join(cache_dir(root), split + '_labels.npy')
+
+
+def _save(path, array): # the file only appears once it is complete, concurrent runs never read half of it
+    tmpname = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmpname, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmpname, path)
+
+def is_cached(root, train):
+    return all(os.path.exists(path) for path in cache_paths(root, train))
+
+def build(root='data', download=False): # write the cached arrays of both splits, if not there yet
+    for train, (images_name, labels_name) in RAW_FILES.items():
+        if is_cached(root, train):
+            continue
+        if download: # fetch the raw files with torchvision, a no-op when they are already there
+            from torchvision import datasets
+            datasets.FashionMNIST(root, train=train, download=True)
+        images_path, labels_path = cache_paths(root, train)
+        os.makedirs(os.path.dirname(images_path), exist_ok=True)
+        images = read_idx(raw_path(root, images_name))
+        X = images.reshape(len(images), 1, 28, 28).astype(np.float32)
+        X *= 1./255.
+        X -= MEAN
+        X /= STD
+        _save(images_path, X)
+        _save(labels_path, read_idx(raw_path(root, labels_name)).astype(np.int64))
+
+def load(train=True, root='data', download=False): # (images [N, 1, 28, 28] float32, labels [N] int64) over the cache
+    if not is_cached(root, train):
+        build(root, download)
+    images_path, labels_path = cache_paths(root, train)
+    # copy-on-write mappings: pages are read on first touch and never written back to the cache
+    X = torch.from_numpy(np.load(images_path, mmap_mode='c'))
+    y = torch.from_numpy(np.load(labels_path, mmap_mode='c'))
+    return X, y
+
+
+class TensorLoader(object): # minibatches of in-memory tensors by tensor indexing, a drop-in for DataLoader loops
+    def __init__(self, X, y, batch_size, shuffle=True, drop_last=False, generator=None):
+        self.dataset = torch.utils.data.TensorDataset(X, y)
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = generator
+
+    def __len__(self): # minibatches per epoch
+        if self.drop_last:
+            return len(self.y)//self.batch_size
+        return -(-len(self.y)//self.batch_size)
+
+    def __iter__(self): # one permutation per epoch, then one gather per minibatch
+        if not self.shuffle: # contiguous slices, no copy
+            for i in range(len(self)):
+                st_idx = i*self.batch_size
+                yield self.X[st_idx:st_idx+self.batch_size], self.y[st_idx:st_idx+self.batch_size]
+            return
+        order = torch.randperm(len(self.y), generator=self.generator)
+        for i in range(len(self)):
+            idx = order[i*self.batch_size:(i+1)*self.batch_size]
+            yield self.X[idx], self.y[idx]
@@ -0,0 +1,82 @@
+## Named phase timers for the training loops and an opt-in torch.profiler trace of a window of steps
+# a disabled PhaseTimer hands out one shared no-op context, so the instrumented loops cost a method call per
+# phase; times are wall-clock on the host, which is exact for the CPU runs of these scripts
+import contextlib
+import time
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function, schedule
+
+
+class _Phase(object):
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        if self.timer.record: # label the phase in the profiler trace
+            self.label = record_function(self.name)
+            self.label.__enter__()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        totals = self.timer.totals
+        totals[self.name] = totals.get(self.name, 0.) + time.perf_counter() - self.start
+        if self.timer.record:
+            self.label.__exit__(*exc)
+
+
+class PhaseTimer(object): # time spent in each named phase since the last summary
+    _off = contextlib.nullcontext()
+
+    def __init__(self, enabled=False, record=False):
+        self.enabled = enabled or record
+        self.record = record # also emit record_function ranges for torch.profiler
+        self.reset()
+
+    def reset(self):
+        self.totals = {}
+        self.start = time.perf_counter()
+
+    def phase(self, name): # with timer.phase('forward'): ...
+        if not self.enabled:
+            return self._off
+        return _Phase(self, name)
+
+    def summary(self): # per-phase breakdown since the last summary, then restart; '' when disabled
+        if not self.enabled:
+            return ''
+        wall = time.perf_counter() - self.start
+        parts = ['{} {:.2f}s ({:.1f}%)'.format(name, t, 100.*t/wall) for name, t in self.totals.items()]
+        other = wall - sum(self.totals.values())
+        parts.append('other {:.2f}s ({:.1f}%)'.format(other, 100.*other/wall))
+        self.reset()
+        return 'Phases over {:.2f}s: '.format(wall) + ', '.join(parts)
+
+DISABLED = PhaseTimer() # default of the functions that take a timer
+
+
+class Tracer(object): # Chrome trace of steps [start, start + steps) written to path, nothing if path is None
+    def __init__(self, path=None, start=10, steps=5):
+        self.prof = None
+        if path is not None:
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            # one warm-up step before the window is recorded, as torch.profiler needs
+            self.prof = profile(activities=activities,
+                                schedule=schedule(wait=max(start - 1, 0), warmup=min(start, 1), active=steps, repeat=1),
+                                on_trace_ready=lambda prof: prof.export_chrome_trace(path))
+            self.prof.start()
+
+    @property
+    def enabled(self):
+        return self.prof is not None
+
+    def step(self): # call once at the end of every training step
+        if self.prof is not None:
+            self.prof.step()
+
+    def close(self): # writes the trace if the window was not complete yet
+        if self.prof is not None:
+            self.prof.stop()
+            self.prof = None
@@ -0,0 +1,98 @@
+## Streaming metrics of a training run: buffered CSV rows, appended to disk on a background thread
+# every row is tagged with the run config; 'step' rows carry loss, violation, step time and bytes sent,
+# 'epoch' rows carry the test metrics. Values may be tensors or futures (e.g. a pending background test),
+# they are converted on the writer thread so logging never waits for the device or for a test
+import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from checkpoint import resolve
+
+COLUMNS = ('kind', 'epoch', 'step', 'loss', 'violation', 'step_time', 'bytes', 'test_loss', 'test_acc')
+TEST = COLUMNS.index('test_loss')
+
+
+def _value(value): # plain number or '' for a CSV cell
+    if value is None:
+        return ''
+    if isinstance(value, torch.Tensor):
+        return value.item()
+    return value
+
+
+class MetricsWriter(object): # rows of one run in path, appended to if it exists and append is set
+    def __init__(self, path, tags=None, flush_every=1000, append=True):
+        self.path = path
+        self.tags = dict(tags or {})
+        self.flush_every = flush_every
+        self.header = list(self.tags) + list(COLUMNS)
+        self.buffer = []
+        self.pool = ThreadPoolExecutor(1)
+        self.pending = None
+        if not append or not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, 'w', newline='') as f:
+                csv.writer(f).writerow(self.header)
+        self.rows = self.written = self._count() # rows logged so far and rows on disk
+        self.last = time.perf_counter()
+
+    def _count(self):
+        with open(self.path, newline='') as f:
+            return sum(1 for _ in f) - 1
+
+    def log(self, kind, epoch, step=None, **values): # one row, values by column name
+        row = [kind, epoch, step] + [values.pop(column, None) for column in COLUMNS[3:]]
+        if values:
+            raise ValueError('unknown metrics columns {}, expected some of {}'.format(sorted(values), COLUMNS[3:]))
+        self.buffer.append(row)
+        self.rows += 1
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def step(self, epoch, step, **values):
+        self.log('step', epoch, step, **values)
+
+    def epoch(self, epoch, test=None, **values): # test: (loss, accuracy) or a future of it
+        self.log('epoch', epoch, test_loss=test, **values)
+
+    def timer(self): # seconds since the previous call (or since the writer was made), for per-step times
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        return elapsed
+
+    def flush(self): # hand the buffered rows to the writer thread; the future gives the rows on disk after them
+        rows, self.buffer = self.buffer, []
+        self.pending = self.pool.submit(self._write, rows)
+        return self.pending
+
+    def _write(self, rows):
+        tags = list(self.tags.values())
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for row in rows:
+                row = resolve(row)
+                if isinstance(row[TEST], tuple): # (loss, accuracy) of a test
+                    row[TEST:TEST+2] = row[TEST]
+                writer.writerow(tags + [_value(value) for value in row])
+        self.written += len(rows)
+        return self.written
+
+    def rewind(self, rows): # keep the first rows of the file, e.g. those covered by the checkpoint resumed from
+        self.flush().result()
+        with open(self.path, newline='') as f:
+            lines = f.readlines()[:rows + 1]
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'w', newline='') as f:
+            f.writelines(lines)
+        os.replace(tmpname, self.path)
+        self.rows = self.written = len(lines) - 1
+
+    def close(self): # write the remaining rows and wait for them
+        self.flush().result()
+        self.pool.shutdown(wait=True)
+
+
+def read_rows(path, kind=None): # rows of a metrics file as dicts of strings, optionally of one kind only
+    with open(path, newline='') as f:
+        return [row for row in csv.DictReader(f) if kind is None or row['kind'] == kind]
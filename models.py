@@ -0,0 +1,62 @@
+## Models of the FashionMNIST scripts, with width and depth knobs for load tests
+# the defaults are the original architectures, with the same parameter names, so their checkpoints still load;
+# input_shape and num_classes follow the data, e.g. the synthetic sets of synthetic.py
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def num_params(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+class Net_FC(nn.Module): # depth hidden layers of width units; about (depth - 1)*width**2 parameters when deep
+    def __init__(self, width=500, depth=1, input_shape=(1, 28, 28), num_classes=10):
+        super(Net_FC, self).__init__()
+        self.in_features = int(torch.Size(input_shape).numel())
+        sizes = [self.in_features] + [int(width)]*depth + [num_classes]
+        self.layers = [] # fc1, fc2, ... in order
+        for i in range(depth + 1):
+            setattr(self, 'fc{}'.format(i + 1), nn.Linear(sizes[i], sizes[i + 1]))
+            self.layers.append(getattr(self, 'fc{}'.format(i + 1)))
+
+    def forward(self, x):
+        x = x.view(-1, self.in_features)
+        for fc in self.layers[:-1]:
+            x = F.relu(fc(x))
+        x = self.layers[-1](x)
+        return F.log_softmax(x, dim=1)
+
+
+class LeNet5(nn.Module): # channels and units scaled by width; depth fully connected hidden layers (default 2)
+    def __init__(self, width=1, depth=2, input_shape=(1, 28, 28), num_classes=10, activation=F.relu):
+        super(LeNet5, self).__init__()
+        channels, size = input_shape[0], input_shape[-1]
+        c1, c2 = max(1, round(6*width)), max(1, round(16*width))
+        self.conv1 = nn.Conv2d(channels, c1, 5, 1)
+        self.conv2 = nn.Conv2d(c1, c2, 5, 1)
+        size = ((size - 4)//2 - 4)//2 # after two 5x5 convolutions and 2x2 poolings
+        self.in_features = c2*size*size # 256 for 28 x 28 images
+        hidden = [max(1, round(120*width))] + [max(1, round(84*width))]*(depth - 1)
+        sizes = [self.in_features] + hidden + [num_classes]
+        self.layers = []
+        for i in range(depth + 1):
+            setattr(self, 'fc{}'.format(i + 1), nn.Linear(sizes[i], sizes[i + 1]))
+            self.layers.append(getattr(self, 'fc{}'.format(i + 1)))
+        self.activation = activation
+
+    def forward(self, x):
+        x = self.activation(self.conv1(x))
+        x = F.max_pool2d(x, 2, 2)
+        x = self.activation(self.conv2(x))
+        x = F.max_pool2d(x, 2, 2)
+        x = x.view(-1, self.in_features)
+        for fc in self.layers[:-1]:
+            x = self.activation(fc(x))
+        x = self.layers[-1](x)
+        return F.log_softmax(x, dim=1)
+
+
+class LeNet5_smooth(LeNet5): # LeNet5 with tanh activations
+    def __init__(self, width=1, depth=2, input_shape=(1, 28, 28), num_classes=10):
+        super(LeNet5_smooth, self).__init__(width, depth, input_shape, num_classes, activation=torch.tanh)
@@ -0,0 +1,178 @@
+## SpiderBoost, PStorm, Hybrid-SGD and proximal Vanilla-SGD for L1 regularized training, as torch optimizers
+# lr is the weight of the regularizer lr*||x||_1, as in the SpiderBoost script; every step updates all
+# parameters of a group with multi-tensor torch._foreach_* kernels, and the previous gradient, direction
+# and iterate live in self.state, so they are saved and restored with state_dict()
+import torch
+from torch.optim import Optimizer
+from prox import soft_threshold_foreach_
+
+
+## update kernels, one call per parameter group; compile=True wraps them with torch.compile
+def _spiderboost_update(params, grads, prev_grads, directions, eta, scale, tau):
+    # v = previous v + (grad - grad at the previous iterate)/scale, x = prox(x - eta*v) onto eta*tau*r;
+    # only the increment is scaled, the first v is grad/scale
+    torch._foreach_add_(directions, grads, alpha=1/scale)
+    torch._foreach_add_(directions, prev_grads, alpha=-1/scale)
+    torch._foreach_add_(params, directions, alpha=-eta)
+    soft_threshold_foreach_(params, tau*eta)
+
+def _pstorm_update(params, grads, prev_grads, directions, eta, beta, scale, tau):
+    # d = grad/scale + (1 - beta)*(previous d - grad at the previous iterate/scale), x = prox(x - eta*d)
+    torch._foreach_mul_(directions, 1 - beta)
+    torch._foreach_add_(directions, prev_grads, alpha=-(1 - beta)/scale)
+    torch._foreach_add_(directions, grads, alpha=1/scale)
+    torch._foreach_add_(params, directions, alpha=-eta)
+    soft_threshold_foreach_(params, tau*eta)
+
+def _hybrid_update(params, grads, other_grads, prev_grads, directions, prev_params, eta, beta, gamma, tau):
+    # v = beta*(grad - previous grad + previous v) + (1 - beta)*(gradient at an independent sample),
+    # x = gamma*prox(x - eta*v) + (1 - gamma)*(previous x)
+    torch._foreach_sub_(directions, prev_grads)
+    torch._foreach_add_(directions, grads)
+    torch._foreach_mul_(directions, beta)
+    torch._foreach_add_(directions, other_grads, alpha=1 - beta)
+    torch._foreach_copy_(prev_grads, grads)
+    torch._foreach_add_(params, directions, alpha=-eta)
+    soft_threshold_foreach_(params, tau*eta)
+    torch._foreach_lerp_(params, prev_params, 1 - gamma)
+    torch._foreach_copy_(prev_params, params)
+
+def _prox_sgd_update(params, grads, step, tau):
+    # x = prox(x - step*grad) onto tau*r
+    torch._foreach_add_(params, grads, alpha=-step)
+    soft_threshold_foreach_(params, tau)
+
+
+class _ProxOptimizer(Optimizer): # shared bookkeeping: step counter per group and the optional compiled kernel
+    def __init__(self, params, defaults, update, compile=False, two_point=False):
+        super(_ProxOptimizer, self).__init__(params, defaults)
+        self._update = torch.compile(update, dynamic=True) if compile else update
+        # recursive estimators: with two_point the caller passes the gradient at prev_params() on the current
+        # minibatch, otherwise the stored gradient of the previous minibatch stands in for it
+        self.two_point = two_point
+        self._history = 'prev_param' if two_point else 'prev_grad'
+
+    def _group_tensors(self, group, *keys): # parameters with a gradient, their gradients and state buffers
+        params = [p for p in group['params'] if p.grad is not None]
+        for p in params:
+            state = self.state[p]
+            for key in keys:
+                if key not in state: # zero history makes the first step the plain scaled gradient step
+                    state[key] = p.detach().clone() if key == 'prev_param' else torch.zeros_like(p)
+        group['step'] = group.get('step', 0) + 1
+        return [params, [p.grad for p in params]] + [[self.state[p][key] for p in params] for key in keys]
+
+    def _prev_grads(self, group, params, grads, history, prev_grads, offset):
+        # gradients at the previous iterate of this group and the offset of the next group in prev_grads
+        if not self.two_point:
+            return history, offset
+        n = len(params)
+        if group['step'] == 1: # no previous iterate, the first direction is the scaled gradient
+            prev = torch._foreach_mul(grads, 0)
+        else:
+            prev = list(prev_grads[offset:offset+n])
+        torch._foreach_copy_(history, params) # current iterate, previous one at the next step
+        return prev, offset + n
+
+    def _end_step(self, grads, history):
+        if not self.two_point:
+            torch._foreach_copy_(history, grads)
+
+    def prev_params(self): # previous iterate of every parameter, None before the first step or without two_point
+        params = [p for group in self.param_groups for p in group['params']]
+        if not self.two_point or not all('prev_param' in self.state[p] for p in params):
+            return None
+        return [self.state[p]['prev_param'] for p in params]
+
+    def _closure_loss(self, closure):
+        if closure is None:
+            return None
+        with torch.enable_grad():
+            return closure()
+
+
+class SpiderBoost(_ProxOptimizer):
+    def __init__(self, params, lr, batch_size, L=2, compile=False, two_point=False):
+        super(SpiderBoost, self).__init__(params, dict(lr=lr, batch_size=batch_size, L=L),
+                                          _spiderboost_update, compile, two_point)
+
+    @torch.no_grad()
+    def step(self, closure=None, prev_grads=None):
+        # prev_grads: with two_point, gradients at prev_params() on the current minibatch
+        loss = self._closure_loss(closure)
+        offset = 0
+        for group in self.param_groups:
+            params, grads, directions, history = self._group_tensors(group, 'direction', self._history)
+            prev, offset = self._prev_grads(group, params, grads, history, prev_grads, offset)
+            eta = 1/(2*group['L'])
+            self._update(params, grads, prev, directions, eta, group['batch_size']**0.5, group['lr'])
+            self._end_step(grads, history)
+        return loss
+
+
+class PStorm(_ProxOptimizer):
+    def __init__(self, params, lr, batch_size, L=2, compile=False, two_point=False):
+        super(PStorm, self).__init__(params, dict(lr=lr, batch_size=batch_size, L=L),
+                                     _pstorm_update, compile, two_point)
+
+    @torch.no_grad()
+    def step(self, closure=None, prev_grads=None):
+        # prev_grads: with two_point, gradients at prev_params() on the current minibatch
+        loss = self._closure_loss(closure)
+        offset = 0
+        for group in self.param_groups:
+            params, grads, directions, history = self._group_tensors(group, 'direction', self._history)
+            prev, offset = self._prev_grads(group, params, grads, history, prev_grads, offset)
+            iter, L = group['step'], group['L']
+            eta0 = (4**1/3)/(8*L)
+            eta = eta0/((iter + 4)**(1/3))
+            eta1 = eta0/((iter + 4 + 1)**(1/3))
+            beta = (1 + (20*(eta*L)**2) - (eta1/eta))/(1 + 4*(eta*iter)**2)
+            self._update(params, grads, prev, directions, eta, beta, group['batch_size']**0.5, group['lr'])
+            self._end_step(grads, history)
+        return loss
+
+
+class HybridSGD(_ProxOptimizer):
+    def __init__(self, params, lr, batch_size, eta=0.25, gamma=0.95, compile=False):
+        super(HybridSGD, self).__init__(params, dict(lr=lr, batch_size=batch_size, eta=eta, gamma=gamma),
+                                        _hybrid_update, compile)
+
+    @torch.no_grad()
+    def step(self, closure=None, other_grads=None):
+        # other_grads: gradients at an independent minibatch, in the order of the parameters with a
+        # gradient; defaults to the gradients themselves
+        loss = self._closure_loss(closure)
+        offset = 0
+        for group in self.param_groups:
+            params, grads, prev_grads, directions, prev_params = \
+                self._group_tensors(group, 'prev_grad', 'direction', 'prev_param')
+            others = grads if other_grads is None else list(other_grads[offset:offset+len(params)])
+            offset += len(params)
+            B0 = group['batch_size']**0.5
+            if group['step'] == 1: # v = grad/B0
+                beta = 1/B0
+                others = prev_grads # zeros
+            else:
+                beta = 1 - 1/((B0*(group['step'] + 1))**0.5)
+            self._update(params, grads, others, prev_grads, directions, prev_params,
+                         group['eta'], beta, group['gamma'], group['lr'])
+        return loss
+
+
+class ProxSGD(_ProxOptimizer): # Vanilla-SGD with step alpha0/sqrt(iter) and prox onto lr*alpha0*r
+    def __init__(self, params, lr, alpha0=1, compile=False):
+        super(ProxSGD, self).__init__(params, dict(lr=lr, alpha0=alpha0), _prox_sgd_update, compile)
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = self._closure_loss(closure)
+        for group in self.param_groups:
+            params = [p for p in group['params'] if p.grad is not None]
+            group['step'] = group.get('step', 0) + 1
+            alpha0 = group['alpha0']
+            self._update(params, [p.grad for p in params], alpha0/(group['step']**0.5), group['lr']*alpha0)
+        return loss
+
+
+OPTIMIZERS = {'SpiderBoost': SpiderBoost, 'PStorm': PStorm, 'Hybrid-SGD': HybridSGD, 'Vanilla-SGD': ProxSGD}
@@ -0,0 +1,131 @@
+## Multi-process mode of the error-compensated compressed SGD scripts, torch.distributed with gloo on one box
+# rank 0 is the central server, ranks 1..W are the local servers; launch with, e.g.,
+#   torchrun --standalone --nproc_per_node=11 "<script>.py" [script options]
+import pickle
+import time
+import numpy.random as random
+import torch
+import torch.distributed as dist
+import torch.nn.functional as F
+from error_feedback import GradientPipeline, WorkerState, ServerState, bucketed_params, flatten_grads
+from async_eval import AsyncEvaluator
+
+
+def init_process_group(): # rank, world size and master address come from the torchrun environment
+    dist.init_process_group('gloo')
+    return dist.get_rank(), dist.get_world_size()
+
+def serialize(obj): # pickled obj as a uint8 tensor, the exact bytes put on the wire
+    return torch.frombuffer(bytearray(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)), dtype=torch.uint8)
+
+def deserialize(buf):
+    return pickle.loads(buf.numpy().tobytes())
+
+
+def send_payloads(payloads, dst=0): # returns bytes sent
+    buf = serialize(payloads)
+    dist.send(torch.tensor([buf.numel()]), dst)
+    dist.send(buf, dst)
+    return buf.numel()
+
+def recv_payloads(src): # returns the payloads and bytes received
+    size = torch.zeros(1, dtype=torch.int64)
+    dist.recv(size, src)
+    buf = torch.empty(int(size), dtype=torch.uint8)
+    dist.recv(buf, src)
+    return deserialize(buf), buf.numel()
+
+def broadcast_payloads(payloads=None, src=0): # payloads given on src only; returns them and bytes per receiver
+    size = torch.zeros(1, dtype=torch.int64)
+    if dist.get_rank() == src:
+        buf = serialize(payloads)
+        size[0] = buf.numel()
+    dist.broadcast(size, src)
+    if dist.get_rank() != src:
+        buf = torch.empty(int(size), dtype=torch.uint8)
+    dist.broadcast(buf, src)
+    if dist.get_rank() != src:
+        payloads = deserialize(buf)
+    return payloads, buf.numel()
+
+
+def train(model, local_Xtrain, local_ytrain, b_sz, compress, step, iter_per_epoch, maxepoch,
+          test_fn=None, seed=20200930, pipelined=False, bucket_bytes=None):
+    # local server w (rank w + 1) trains on the shard local_Xtrain[w], one shard per local server;
+    # step(iter) is the step size of the central server at round iter; pipelined compresses each layer
+    # on a thread as soon as backward has produced its gradient; bucket_bytes as in error_feedback.bucket_ranges
+    rank, world = dist.get_rank(), dist.get_world_size()
+    num_workers = world - 1
+    params = list(model.parameters())
+    shapes = [p.size() for p in params]
+    numel = sum(p.numel() for p in params)
+    targets = bucketed_params(params, bucket_bytes) # the model bucket by bucket, where the updates are applied
+
+    if rank == 0:
+        server = ServerState(shapes, num_workers, bucket_bytes=bucket_bytes)
+        if test_fn is not None: # test in the background while the next epoch trains
+            evaluator = AsyncEvaluator(model, test_fn)
+    else:
+        random.seed(seed + rank)
+        state = WorkerState(torch.zeros(numel), shapes, bucket_bytes)
+        gradbuf = torch.zeros(numel)
+        pipeline = GradientPipeline(params, compress, bucket_bytes) if pipelined else None
+        Xtrain = local_Xtrain[rank - 1]
+        ytrain = local_ytrain[rank - 1]
+
+    iter = 1
+    history = [] # per epoch on rank 0: (seconds, bytes per round on the wire, bytes per round in payloads, test result)
+    for epoch in range(maxepoch):
+        dist.barrier()
+        start = time.perf_counter()
+        epochbytes = 0 # serialized bytes sent by local and central servers
+        payloadbytes = 0 # bytes of the payloads themselves, as counted in the simulated mode
+        for k in range(iter_per_epoch):
+            if rank == 0:
+                # receive every compressed gradient, aggregate, compress and broadcast the update
+                server.start_round()
+                for src in range(1, world):
+                    payloads, nbytes = recv_payloads(src)
+                    server.receive(payloads)
+                    epochbytes += nbytes
+                payloads = server.update(targets, compress, step(iter))
+                _, nbytes = broadcast_payloads(payloads)
+                epochbytes += num_workers*nbytes
+                payloadbytes += server.nbytes
+            else:
+                st_idx = random.randint(0, len(ytrain) - b_sz + 1)
+                data = Xtrain[st_idx:st_idx+b_sz,]
+                target = ytrain[st_idx:st_idx+b_sz,]
+                model.zero_grad()
+                loss = F.nll_loss(model(data), target)
+                if pipeline is not None:
+                    pipeline.start(state)
+                    loss.backward()
+                    send_payloads(pipeline.finish())
+                else:
+                    loss.backward()
+                    flatten_grads(params, gradbuf)
+                    send_payloads(state.compress(gradbuf, compress))
+                # apply the same compressed update as the central server to keep the replica in sync
+                payloads, _ = broadcast_payloads()
+                for p, payload in zip(targets, payloads):
+                    payload.add_to(p.data, alpha=-step(iter))
+                if rank == 1 and k % 10 == 0:
+                    print('Train Epoch: {} [{}/{} ({:.0f}%)]\tLoss: {:.6f}'.format(
+                        epoch, k, iter_per_epoch, 100. * k / iter_per_epoch, loss.item()))
+            iter += 1
+
+        if rank == 0:
+            elapsed = time.perf_counter() - start
+            print('\nEpoch {}: {:.1f} rounds/s with {} local servers, {:.0f} bytes per round on the wire '
+                  '({:.0f} in payloads)'.format(epoch, iter_per_epoch/elapsed, num_workers,
+                                                 epochbytes/iter_per_epoch, payloadbytes/iter_per_epoch))
+            if test_fn is not None:
+                evaluator.submit(model)
+            history.append((elapsed, epochbytes/iter_per_epoch, payloadbytes/iter_per_epoch, None))
+    if rank != 0 and pipeline is not None:
+        pipeline.close()
+    if rank == 0 and test_fn is not None: # join the test results into the history, in epoch order
+        history = [row[:3] + (result,) for row, result in zip(history, evaluator.results())]
+        evaluator.close()
+    return history
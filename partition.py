@@ -0,0 +1,85 @@
+## Training-set shards of the local servers: by class, IID or Dirichlet non-IID, in one vectorized pass
+# a partition is (order, offsets): order lists the training indices worker by worker and worker w owns
+# order[offsets[w]:offsets[w+1]]; partitions are cached on disk, keyed by scheme, seed and number of workers
+import os
+import numpy as np
+import torch
+
+
+def class_partition(targets, num_workers, rng): # worker w gets the classes w, w + W, ..., one class after the other
+    num_classes = int(targets.max()) + 1
+    worker = targets % num_workers
+    order = np.argsort(worker*num_classes + targets, kind='stable') # ascending index within each class
+    return order, np.bincount(worker, minlength=num_workers)
+
+def iid_partition(targets, num_workers, rng): # a random permutation cut into equal pieces
+    n = len(targets)
+    sizes = np.diff(np.arange(num_workers + 1)*n//num_workers)
+    return rng.permutation(n), sizes
+
+def dirichlet_partition(targets, num_workers, rng, alpha=0.5): # class c split across workers in Dir(alpha) proportions
+    n = len(targets)
+    num_classes = int(targets.max()) + 1
+    # shuffle, then group by class: random order within each class
+    perm = rng.permutation(n)
+    bycls = perm[np.argsort(targets[perm], kind='stable')]
+    cls = targets[bycls]
+    counts = np.bincount(cls, minlength=num_classes)
+    rank = np.arange(n) - (np.cumsum(counts) - counts)[cls] # position of each sample within its class
+    cumprops = np.cumsum(rng.dirichlet(alpha*np.ones(num_workers), size=num_classes), axis=1)
+    # worker of the sample at quantile q of class c: first w with q < cumprops[c, w]
+    worker = ((rank + 0.5)/counts[cls])[:, None] > cumprops[cls]
+    worker = np.minimum(worker.sum(1), num_workers - 1)
+    # worker by worker, in random order within each shard so that contiguous minibatches mix its classes
+    return bycls[np.lexsort((rng.random(n), worker))], np.bincount(worker, minlength=num_workers)
+
+SCHEMES = ('class', 'iid', 'dirichlet')
+
+
+def check_sizes(offsets, min_size, scheme): # every shard must hold at least min_size samples, e.g. one minibatch
+    sizes = np.diff(offsets)
+    if sizes.min() < min_size:
+        w = int(sizes.argmin())
+        hint = 'a larger alpha or fewer local servers' if scheme == 'dirichlet' else 'fewer local servers'
+        raise ValueError('the {} partition gives local server {} only {} samples, fewer than {}; use {}'.format(
+            scheme, w, int(sizes[w]), min_size, hint))
+
+def partition(targets, scheme='class', num_workers=10, seed=20200930, alpha=0.5,
+              cache_dir=None, min_size=1): # (order, offsets) of the training set, cached in cache_dir if given
+    # raises ValueError if a shard gets fewer than min_size samples
+    if scheme not in SCHEMES:
+        raise ValueError('unknown partition scheme {!r}, expected one of {}'.format(scheme, SCHEMES))
+    name = '{}-seed={}-workers={}'.format(scheme, seed, num_workers)
+    if scheme == 'dirichlet':
+        name += '-alpha={}-mixed'.format(alpha) # shards were sorted by class in earlier caches
+    path = os.path.join(cache_dir, name + '.npz') if cache_dir is not None else None
+    if path is not None and os.path.exists(path):
+        with np.load(path) as cached:
+            if cached['n'] == len(targets):
+                check_sizes(cached['offsets'], min_size, scheme)
+                return cached['order'], cached['offsets']
+
+    targets = np.asarray(targets)
+    rng = np.random.default_rng(seed)
+    if scheme == 'class':
+        order, sizes = class_partition(targets, num_workers, rng)
+    elif scheme == 'iid':
+        order, sizes = iid_partition(targets, num_workers, rng)
+    else:
+        order, sizes = dirichlet_partition(targets, num_workers, rng, alpha)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    check_sizes(offsets, min_size, scheme)
+
+    if path is not None: # the file only appears once it is complete
+        os.makedirs(cache_dir, exist_ok=True)
+        tmpname = '{}.{}.tmp.npz'.format(path[:-len('.npz')], os.getpid())
+        np.savez(tmpname, order=order, offsets=offsets, n=len(targets))
+        os.replace(tmpname, path)
+    return order, offsets
+
+def shard(X, y, order, offsets): # reorder the training set once, every worker gets contiguous views into it
+    order = torch.as_tensor(order)
+    X = X[order]
+    y = y[order]
+    return [X[offsets[w]:offsets[w+1]] for w in range(len(offsets) - 1)], \
+        [y[offsets[w]:offsets[w+1]] for w in range(len(offsets) - 1)]
@@ -0,0 +1,58 @@
+## Proximal operator of the L1 regularizer tau*||x||_1 (soft-thresholding)
+import torch
+
+
+def soft_threshold_(atensor, tau): # atensor <- sign(atensor)*max(|atensor| - tau, 0), in place
+    # a single elementwise pass writing into atensor itself: no masks, clones or scatter-backs
+    return torch.ops.aten.softshrink.out(atensor, tau, out=atensor)
+
+def soft_threshold_foreach_(tensors, tau): # soft_threshold_ on every tensor of a list
+    # one in-place pass per tensor, no temporaries
+    if tau == 0: # prox of the zero regularizer
+        return tensors
+    for atensor in tensors:
+        soft_threshold_(atensor, tau)
+    return tensors
+
+
+class ViolationMonitor(object): # stationarity violation sum over layers of ||prox(x - grad) onto lr*r - x||
+    # measured on every every-th step only, optionally on a subset of the layers (indices into params),
+    # in preallocated scratch buffers; the result is kept as a python float, no tensor outlives a measurement
+    def __init__(self, params, lr, every=1, layers=None):
+        params = list(params)
+        self.params = params if layers is None else [params[i] for i in layers]
+        self.lr = lr
+        self.every = every
+        self.value = 0.
+        self.steps = 0
+        numel = sum(p.numel() for p in self.params)
+        self.scratch = torch.empty(numel, dtype=self.params[0].dtype, device=self.params[0].device)
+        self.views = []
+        offset = 0
+        for p in self.params:
+            self.views.append(self.scratch[offset:offset+p.numel()].view(p.shape))
+            offset += p.numel()
+
+    def reset(self): # restart the cadence, e.g. at the start of an epoch
+        self.steps = 0
+
+    def step(self): # call once per training step; returns the latest measured violation
+        if self.steps % self.every == 0:
+            self.measure()
+        self.steps += 1
+        return self.value
+
+    @torch.no_grad()
+    def measure(self):
+        xs = [p.detach() for p in self.params]
+        grads = [p.grad for p in self.params]
+        if self.lr == 0: # violation = norm(grad)
+            norms = torch._foreach_norm(grads)
+        else: # x - grad, its proximal mapping onto lr*r, minus x
+            torch._foreach_copy_(self.views, xs)
+            torch._foreach_sub_(self.views, grads)
+            soft_threshold_(self.scratch, self.lr) # one pass over the flat buffer behind the views
+            torch._foreach_sub_(self.views, xs)
+            norms = torch._foreach_norm(self.views)
+        self.value = float(torch.stack(norms).sum())
+        return self.value
@@ -0,0 +1,64 @@
+## Parallel, resumable hyperparameter sweeps over independent training runs
+import csv
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import torch
+from metrics import MetricsWriter, read_rows
+
+
+def grid(**axes): # cartesian product of the keyword lists, as a list of config dicts
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in itertools.product(*axes.values())]
+
+def result_name(config, prefix=''): # result file of a config, e.g. 'b_sz=5,lr=0.01,sfactor=0.1.csv'
+    return prefix + ','.join('{}={}'.format(key, value) for key, value in config.items()) + '.csv'
+
+
+def _init_process(num_threads): # pin the intra-op thread pool of every sweep process
+    torch.set_num_threads(num_threads)
+
+def _run_one(fn, config, filename, checkpoint): # one training run; the result file only appears once the run is complete
+    kwargs = dict(config)
+    tmpname = filename + '.tmp'
+    if checkpoint: # fn resumes from and saves to a checkpoint file next to the result file
+        kwargs['checkpoint'] = filename + '.ckpt'
+    elif os.path.exists(tmpname): # rows of an interrupted run, which starts over
+        os.remove(tmpname)
+    metrics = MetricsWriter(tmpname, tags=config)
+    fn(metrics=metrics, **kwargs)
+    metrics.close()
+    os.replace(tmpname, filename)
+    if checkpoint and os.path.exists(kwargs['checkpoint']):
+        os.remove(kwargs['checkpoint'])
+    return filename
+
+
+def run_sweep(fn, configs, filename=result_name, processes=None, threads_per_process=1,
+              table='sweep_results.csv', checkpoint=False):
+    # fn(metrics=<MetricsWriter>, **config) runs one configuration and logs its rows to metrics;
+    # fn must be a module-level function, sweep processes are forked from the caller;
+    # with checkpoint, fn also takes checkpoint=<file> and an interrupted sweep resumes its runs mid-way
+    if processes is None:
+        processes = max(1, (os.cpu_count() or 1)//threads_per_process)
+
+    todo = [config for config in configs if not os.path.exists(filename(config))]
+    print('Sweep: {} configurations, {} already done, {} processes x {} threads'.format(
+        len(configs), len(configs) - len(todo), processes, threads_per_process))
+
+    if todo:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_init_process, initargs=(threads_per_process,)) as pool:
+            futures = {pool.submit(_run_one, fn, config, filename(config), checkpoint): config for config in todo}
+            for future in as_completed(futures):
+                print('Sweep: finished {}'.format(future.result()))
+
+    # one row per (configuration, epoch), configuration values first; per-step rows stay in the run files
+    rows = [row for config in configs for row in read_rows(filename(config), 'epoch')]
+    if table is not None and rows:
+        with open(table, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
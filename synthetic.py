@@ -0,0 +1,117 @@
+## Synthetic FashionMNIST-shaped data for load tests: any number of samples, image size and classes, no download
+# a sample is the smooth prototype of its class plus Gaussian noise, roughly zero mean and unit variance like the
+# normalized FashionMNIST cache, so the models still learn on it. `load` writes memory-mapped arrays once, in
+# chunks, and serves them like fmnist_cache.load; `SyntheticLoader` generates every minibatch on the fly instead
+import os
+import numpy as np
+import torch
+import torch.nn.functional as F
+import fmnist_cache
+
+CHUNK = 8192 # samples generated at a time
+
+
+def prototypes(image_size=28, num_classes=10, channels=1, seed=20200930): # [num_classes, channels, size, size]
+    gen = torch.Generator().manual_seed(seed)
+    coarse = torch.randn(num_classes, channels, 7, 7, generator=gen)
+    return F.interpolate(coarse, size=(image_size, image_size), mode='bilinear', align_corners=False)
+
+def generate(n, protos, noise=1., generator=None): # n samples and labels around the class prototypes
+    y = torch.randint(0, len(protos), (n,), generator=generator)
+    X = protos[y] + noise*torch.randn((n,) + protos.shape[1:], generator=generator)
+    return X, y
+
+
+def cache_paths(root, train, n, image_size, num_classes, channels, noise, seed):
+    name = 'n={}-size={}-classes={}-channels={}-noise={}-seed={}-{}'.format(
+        n, image_size, num_classes, channels, noise, seed, 'train' if train else 'test')
+    directory = os.path.join(root, 'synthetic')
+    return os.path.join(directory, name + '-X.npy'), os.path.join(directory, name + '-y.npy')
+
+def build(path_X, path_y, n, protos, noise, seed): # written in chunks, so n can exceed the memory
+    os.makedirs(os.path.dirname(path_X), exist_ok=True)
+    tmp_X = '{}.{}.tmp.npy'.format(path_X[:-len('.npy')], os.getpid())
+    tmp_y = '{}.{}.tmp.npy'.format(path_y[:-len('.npy')], os.getpid())
+    X = np.lib.format.open_memmap(tmp_X, mode='w+', dtype=np.float32, shape=(n,) + tuple(protos.shape[1:]))
+    y = np.lib.format.open_memmap(tmp_y, mode='w+', dtype=np.int64, shape=(n,))
+    for start in range(0, n, CHUNK):
+        gen = torch.Generator().manual_seed(seed*1000003 + start//CHUNK) # each chunk on its own stream
+        Xc, yc = generate(min(CHUNK, n - start), protos, noise, gen)
+        X[start:start + len(yc)] = Xc.numpy()
+        y[start:start + len(yc)] = yc.numpy()
+    X.flush()
+    y.flush()
+    del X, y
+    os.replace(tmp_X, path_X) # labels last: a set is complete once both files exist
+    os.replace(tmp_y, path_y)
+
+def load(train=True, n=60000, n_test=10000, image_size=28, num_classes=10, channels=1, noise=1.,
+         seed=20200930, root='data'): # (X [N, channels, size, size] float32, y [N] int64), memory-mapped
+    size = n if train else n_test
+    path_X, path_y = cache_paths(root, train, size, image_size, num_classes, channels, noise, seed)
+    if not (os.path.exists(path_X) and os.path.exists(path_y)):
+        protos = prototypes(image_size, num_classes, channels, seed)
+        build(path_X, path_y, size, protos, noise, seed + (0 if train else 1))
+    # copy-on-write maps, as in fmnist_cache.load
+    return torch.from_numpy(np.load(path_X, mmap_mode='c')), torch.from_numpy(np.load(path_y, mmap_mode='c'))
+
+
+class SyntheticLoader(object): # fresh minibatches every epoch, nothing stored; iterates like TensorLoader
+    # the samples follow the prototypes of the memory-mapped set with the same seed, stream picks the minibatches
+    def __init__(self, n, batch_size, image_size=28, num_classes=10, channels=1, noise=1., seed=20200930, stream=0):
+        self.n = n
+        self.batch_size = batch_size
+        self.noise = noise
+        self.protos = prototypes(image_size, num_classes, channels, seed)
+        self.generator = torch.Generator().manual_seed(seed + 2 + stream) # continues across epochs
+        self.dataset = range(n) # len(loader.dataset), as for a TensorLoader
+
+    def __len__(self):
+        return (self.n + self.batch_size - 1)//self.batch_size
+
+    def __iter__(self):
+        for start in range(0, self.n, self.batch_size):
+            yield generate(min(self.batch_size, self.n - start), self.protos, self.noise, self.generator)
+
+
+def add_arguments(parser): # command-line knobs of the synthetic data and of the model size
+    parser.add_argument('--synthetic', type=int, default=None, metavar='N',
+                        help='train on N synthetic samples instead of FashionMNIST')
+    parser.add_argument('--synthetic-test', type=int, default=10000, metavar='N',
+                        help='synthetic test samples (default: 10000)')
+    parser.add_argument('--image-size', type=int, default=28, metavar='N',
+                        help='side of the synthetic images (default: 28)')
+    parser.add_argument('--classes', type=int, default=10, metavar='N',
+                        help='classes of the synthetic data (default: 10)')
+    parser.add_argument('--synthetic-stream', action='store_true', default=False,
+                        help='generate the synthetic minibatches on the fly where the script supports it')
+    parser.add_argument('--width', type=float, default=None, metavar='W',
+                        help='hidden units of Net_FC, channel and unit multiplier of LeNet5')
+    parser.add_argument('--depth', type=int, default=None, metavar='N',
+                        help='hidden fully connected layers of the model')
+    return parser
+
+def settings(args): # (synthetic data settings or None, model size settings) from add_arguments options
+    data = None
+    if args.synthetic is not None:
+        data = {'n': args.synthetic, 'n_test': args.synthetic_test, 'image_size': args.image_size,
+                'num_classes': args.classes}
+        if args.synthetic_stream:
+            data['stream'] = True
+    size = {key: value for key, value in (('width', args.width), ('depth', args.depth)) if value is not None}
+    return data, size
+
+
+def dataset(train=True, synthetic=None, download=False): # FashionMNIST from the local cache, or a synthetic set
+    if synthetic is None:
+        return fmnist_cache.load(train=train, download=download)
+    synthetic = {key: value for key, value in synthetic.items() if key != 'stream'}
+    return load(train=train, **synthetic)
+
+def stream_loader(batch_size, synthetic, stream=0): # on-the-fly training minibatches of the synthetic settings
+    keys = ('image_size', 'num_classes', 'channels', 'noise', 'seed')
+    return SyntheticLoader(synthetic['n'], batch_size, stream=stream,
+                           **{key: synthetic[key] for key in keys if key in synthetic})
+
+def num_classes(synthetic=None):
+    return 10 if synthetic is None else synthetic.get('num_classes', 10)
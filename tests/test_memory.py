@@ -0,0 +1,58 @@
+## Persistent state of the training scripts stays the same size across epochs
+# the scripts are resumed from their own checkpoints: the state saved after epoch 1 and after epoch 3 must hold
+# the same tensors, so nothing accumulates per step or per epoch (optimizer history, error-feedback buffers)
+import importlib.util
+import os
+import sys
+import torch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+SYNTHETIC = {'n': 1280, 'n_test': 100} # small synthetic set, generated under the test's directory
+
+
+def load_script(filename): # a script with spaces in its name, as a module
+    name = filename.split()[0].replace('-', '_').replace(',', '')
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def tensor_bytes(obj): # bytes of all tensors in nested dicts, lists and tuples
+    if isinstance(obj, torch.Tensor):
+        return obj.numel()*obj.element_size()
+    if isinstance(obj, dict):
+        return sum(tensor_bytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(tensor_bytes(value) for value in obj)
+    return 0
+
+def state_sizes(run, path, keys): # tensor bytes of the checkpointed keys after epochs 1 and 3
+    sizes = []
+    epochs_done = []
+    for epochs in (1, 3):
+        run(epochs, path) # resumes from the previous run's checkpoint
+        state = torch.load(path, weights_only=False)
+        sizes.append({key: tensor_bytes(state[key]) for key in keys})
+        epochs_done.append(state['epoch'])
+    assert epochs_done[1] == epochs_done[0] + 2 # the second run trained two more epochs
+    return sizes
+
+
+def test_spiderboost_state_is_constant(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    script = load_script('SpiderBoost, PStorm, Vanilla & Hybrid SGD for FashionMNIST.py')
+    for opttype in ('SpiderBoost', 'Hybrid-SGD'):
+        run = lambda epochs, path: script.main(opttype, 1e-4, epochs=epochs, synthetic=SYNTHETIC, checkpoint=path)
+        first, last = state_sizes(run, str(tmp_path/(opttype + '.ckpt')), ('model', 'optimizer'))
+        assert first['optimizer'] > 0
+        assert first == last
+
+def test_error_feedback_state_is_constant(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    script = load_script('Error-compensated compressed SGD with top-s sparsification for FashionMNIST.py')
+    run = lambda epochs, path: script.main(10, 1e-2, 0.1, maxepoch=epochs, synthetic=SYNTHETIC, checkpoint=path)
+    first, last = state_sizes(run, str(tmp_path/'top-s.ckpt'), ('model', 'workers', 'server'))
+    assert first['workers'] > 0
+    assert first == last
@@ -0,0 +1,40 @@
+## Regression checks of the optimizers on the deterministic quadratic 0.5*||x||^2, whose gradient is x
+import os
+import sys
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from optimizers import OPTIMIZERS
+
+
+def minimize(name, steps=100, batch_size=4, two_point=False, **kwargs): # x after steps from x = 3, no regularizer
+    x = torch.nn.Parameter(torch.tensor([3.]))
+    if name == 'Vanilla-SGD':
+        optimizer = OPTIMIZERS[name]([x], 0., **kwargs)
+    else:
+        optimizer = OPTIMIZERS[name]([x], 0., batch_size, two_point=two_point, **kwargs)
+    for _ in range(steps):
+        x.grad = x.detach().clone()
+        if two_point:
+            prev = optimizer.prev_params()
+            optimizer.step(prev_grads=None if prev is None else [prev[0].clone()])
+        else:
+            optimizer.step()
+    return float(x.detach())
+
+
+def test_spiderboost_converges():
+    # exact gradients: v is the gradient/sqrt(batch_size) at every step, x shrinks by 1 - eta/2 each step
+    assert abs(minimize('SpiderBoost')) < 1e-4
+    assert abs(minimize('Vanilla-SGD')) < 1e-4
+
+def test_spiderboost_two_point_converges():
+    assert abs(minimize('SpiderBoost', two_point=True)) < 1e-4
+
+def test_spiderboost_direction_is_scaled_gradient():
+    x = torch.nn.Parameter(torch.tensor([3.]))
+    optimizer = OPTIMIZERS['SpiderBoost']([x], 0., 4)
+    for _ in range(5):
+        x.grad = x.detach().clone()
+        optimizer.step()
+        assert torch.allclose(optimizer.state[x]['direction'], x.grad/2)